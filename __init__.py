@@ -4,7 +4,10 @@ from dotenv import load_dotenv
 from models import db
 from auth import login_manager, auth_bp
 from routes import main_bp
+from api import api_bp
 from utils import format_datetime_local
+from conexao import opcoes_engine
+import metricas
 from sqlalchemy.exc import OperationalError
 
 load_dotenv()
@@ -17,14 +20,19 @@ def create_app():
     app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL')
     
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = opcoes_engine(app.config['SQLALCHEMY_DATABASE_URI'])
+    app.config['DB_STATEMENT_TIMEOUT'] = int(os.getenv('DB_STATEMENT_TIMEOUT') or 30000)
+    app.config['BLOQUEAR_ESTOQUE_NEGATIVO'] = os.getenv('BLOQUEAR_ESTOQUE_NEGATIVO', '').lower() in ('1', 'true', 'sim')
 
     db.init_app(app)
     login_manager.init_app(app)
     
     app.register_blueprint(auth_bp)
     app.register_blueprint(main_bp)
+    app.register_blueprint(api_bp)
 
     app.jinja_env.filters['localtime'] = format_datetime_local
+    metricas.registrar(app)
 
     @app.errorhandler(OperationalError)
     def handle_db_connection_error(e):
@@ -0,0 +1,201 @@
+"""API JSON versionada (/api/v1) para o PDV e scripts.
+
+Usa as mesmas consultas das telas (consultas.py), sem renderizar templates.
+Parâmetros comuns das listagens:
+
+- `cursor`: valor de `next_cursor` da página anterior;
+- `limite`: itens por página (padrão 20, máximo 100);
+- `campos`: lista separada por vírgulas dos campos devolvidos (ex.: `id,nome`);
+- `dia`, `mes`, `ano`: período na data local da loja (exceto produtos).
+
+`/relatorios/tendencia` devolve a série de receita, custo e lucro por
+categoria e o fluxo do caixa entre `inicio` e `fim` (inclusive), agrupada por
+`granularidade` (`dia`, `semana` ou `mes`).
+"""
+from datetime import date, timedelta
+from flask import Blueprint, jsonify, request, abort
+from flask_login import current_user
+from werkzeug.exceptions import HTTPException
+from models import Produto, Entrada, Saida, Servico, Caixa
+from utils import agora_local, ANO_MINIMO, ANO_MAXIMO
+import consultas
+import resumo
+import versoes
+import conexao
+
+api_bp = Blueprint('api', __name__, url_prefix='/api/v1')
+
+LIMITE_MAXIMO = 100
+PONTOS_MAXIMOS = 1000
+# Período padrão da tendência, em dias antes de hoje
+PERIODO_PADRAO = {'dia': 30, 'semana': 7 * 12, 'mes': 365}
+
+
+@api_bp.before_request
+def _exigir_login():
+    # Sem redirecionar para a tela de login: clientes da API esperam JSON
+    if not current_user.is_authenticated:
+        abort(401)
+
+
+@api_bp.errorhandler(HTTPException)
+def _erro_json(erro):
+    return jsonify({'erro': erro.name, 'mensagem': erro.description}), erro.code
+
+
+def _campos(disponiveis):
+    """Campos pedidos em `?campos=`; todos quando ausente."""
+    pedidos = request.args.get('campos')
+    if not pedidos:
+        return None
+    campos = [c.strip() for c in pedidos.split(',') if c.strip()]
+    invalidos = [c for c in campos if c not in disponiveis]
+    if invalidos:
+        abort(400, f'Campos inválidos: {", ".join(invalidos)}.')
+    return campos
+
+
+def _serializar(obj, campos):
+    dados = obj.to_dict()
+    return {c: dados[c] for c in campos} if campos else dados
+
+
+def _periodo():
+    periodo = {
+        'dia': request.args.get('dia', type=int),
+        'mes': request.args.get('mes', type=int),
+        'ano': request.args.get('ano', type=int),
+    }
+    limites = {'dia': (1, 31), 'mes': (1, 12), 'ano': (ANO_MINIMO, ANO_MAXIMO)}
+    for nome, valor in periodo.items():
+        minimo, maximo = limites[nome]
+        if valor is not None and not minimo <= valor <= maximo:
+            abort(400, f'`{nome}` deve estar entre {minimo} e {maximo}.')
+    return periodo
+
+
+def _listagem(listar, disponiveis, **filtros):
+    campos = _campos(disponiveis)
+    limite = min(max(request.args.get('limite', consultas.POR_PAGINA, type=int), 1), LIMITE_MAXIMO)
+    pagina = listar(request.args.get('cursor'), limite, **filtros)
+    return jsonify({
+        'items': [_serializar(obj, campos) for obj in pagina.items],
+        'has_next': pagina.has_next,
+        'next_cursor': pagina.next_cursor,
+    })
+
+
+def _registro(model, id, disponiveis):
+    return jsonify(_serializar(model.query.get_or_404(id), _campos(disponiveis)))
+
+
+# Campos de cada recurso (as chaves de `to_dict()` do modelo)
+CAMPOS_PRODUTO = ('id', 'nome', 'tipo', 'preco_venda', 'custo', 'estoque')
+CAMPOS_ENTRADA = ('id', 'data', 'produto_id', 'produto_nome', 'quantidade', 'custo_unitario', 'total_custo')
+CAMPOS_SAIDA = ('id', 'data', 'produto_id', 'produto_nome', 'quantidade', 'preco_unitario', 'total_venda',
+                'forma_pagamento', 'pagamento_codigo', 'cliente', 'venda_id')
+CAMPOS_SERVICO = ('id', 'data_hora', 'servico_descricao', 'aparelho', 'tipo', 'subtipo', 'custo_pecas',
+                  'mao_de_obra', 'preco_aparelho', 'status', 'forma_pagamento', 'pagamento_codigo', 'cliente')
+CAMPOS_CAIXA = ('id', 'data', 'tipo', 'valor', 'descricao', 'saldo', 'origem_id', 'origem_tipo')
+
+
+@api_bp.route('/produtos')
+@conexao.repetir_leitura
+@versoes.condicional('produtos')
+def produtos():
+    return _listagem(consultas.listar_produtos, CAMPOS_PRODUTO, q=request.args.get('q'))
+
+
+@api_bp.route('/produtos/<int:id>')
+@conexao.repetir_leitura
+@versoes.condicional('produtos')
+def produto(id):
+    return _registro(Produto, id, CAMPOS_PRODUTO)
+
+
+@api_bp.route('/entradas')
+@conexao.repetir_leitura
+@versoes.condicional('entradas', 'produtos')
+def entradas():
+    return _listagem(consultas.listar_entradas, CAMPOS_ENTRADA,
+                     produto_id=request.args.get('produto_id', type=int), **_periodo())
+
+
+@api_bp.route('/entradas/<int:id>')
+@conexao.repetir_leitura
+@versoes.condicional('entradas', 'produtos')
+def entrada(id):
+    return _registro(Entrada, id, CAMPOS_ENTRADA)
+
+
+@api_bp.route('/saidas')
+@conexao.repetir_leitura
+@versoes.condicional('saidas', 'produtos')
+def saidas():
+    return _listagem(consultas.listar_saidas, CAMPOS_SAIDA,
+                     produto_id=request.args.get('produto_id', type=int),
+                     pagamento=request.args.get('pagamento'),
+                     cliente=request.args.get('cliente'), **_periodo())
+
+
+@api_bp.route('/saidas/<int:id>')
+@conexao.repetir_leitura
+@versoes.condicional('saidas', 'produtos')
+def saida(id):
+    return _registro(Saida, id, CAMPOS_SAIDA)
+
+
+@api_bp.route('/servicos')
+@conexao.repetir_leitura
+@versoes.condicional('servicos')
+def servicos():
+    return _listagem(consultas.listar_servicos, CAMPOS_SERVICO,
+                     status=request.args.get('status'), tipo=request.args.get('tipo'),
+                     subtipo=request.args.get('subtipo'), pagamento=request.args.get('pagamento'), **_periodo())
+
+
+@api_bp.route('/servicos/<int:id>')
+@conexao.repetir_leitura
+@versoes.condicional('servicos')
+def servico(id):
+    return _registro(Servico, id, CAMPOS_SERVICO)
+
+
+@api_bp.route('/caixa')
+@conexao.repetir_leitura
+@versoes.condicional('caixa')
+def caixa():
+    return _listagem(consultas.listar_caixa, CAMPOS_CAIXA, tipo=request.args.get('tipo'), **_periodo())
+
+
+@api_bp.route('/caixa/<int:id>')
+@conexao.repetir_leitura
+@versoes.condicional('caixa')
+def transacao_caixa(id):
+    return _registro(Caixa, id, CAMPOS_CAIXA)
+
+
+@api_bp.route('/relatorios/tendencia')
+@conexao.repetir_leitura
+@versoes.condicional('resumo_diario')
+def tendencia():
+    granularidade = request.args.get('granularidade', 'mes')
+    if granularidade not in resumo.GRANULARIDADES:
+        abort(400, f'Granularidade inválida: use {", ".join(resumo.GRANULARIDADES)}.')
+    try:
+        fim = date.fromisoformat(request.args['fim']) if request.args.get('fim') else agora_local().date()
+        inicio = (date.fromisoformat(request.args['inicio']) if request.args.get('inicio')
+                  else resumo.inicio_periodo(fim - timedelta(days=PERIODO_PADRAO[granularidade]), granularidade))
+    except ValueError:
+        abort(400, 'Datas no formato AAAA-MM-DD.')
+    except OverflowError:
+        inicio = date.min
+    if not (ANO_MINIMO <= inicio.year and fim.year <= ANO_MAXIMO):
+        abort(400, f'Use datas entre os anos {ANO_MINIMO} e {ANO_MAXIMO}.')
+    if inicio > fim:
+        abort(400, 'A data inicial é posterior à final.')
+
+    pontos = (fim - inicio).days // {'dia': 1, 'semana': 7, 'mes': 28}[granularidade]
+    if pontos > PONTOS_MAXIMOS:
+        abort(400, f'Período longo demais para a granularidade (máximo de {PONTOS_MAXIMOS} pontos).')
+    return jsonify(resumo.tendencia(inicio, fim + timedelta(days=1), granularidade))
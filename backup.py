@@ -0,0 +1,125 @@
+"""Backup do banco de dados enviado em fluxo, sem arquivos temporários.
+
+No PostgreSQL a saída do `pg_dump` no formato custom (já compactado, gzip ou
+zstd) vai direto para a resposta em blocos, então o tamanho do backup não
+depende do disco local. Para outros bancos (ou quando se quer planilhas) há o
+instantâneo em CSV: um arquivo .zip com um CSV por tabela, também gerado em
+fluxo a partir de cursores do lado do servidor.
+"""
+import csv
+import io
+import logging
+import os
+import subprocess
+import zipfile
+from sqlalchemy import select, text
+from models import db
+
+TAMANHO_BLOCO = 64 * 1024
+LINHAS_POR_BLOCO = 1000
+
+COMPRESSOES = {'gzip': 'gzip:6', 'zstd': 'zstd:3', 'nenhuma': 'none'}
+
+log = logging.getLogger(__name__)
+
+
+class ErroBackup(Exception):
+    pass
+
+
+def _ambiente_pg():
+    # Senha só no ambiente do processo filho, sem alterar os.environ do servidor
+    return {**os.environ, 'PGPASSWORD': os.getenv('DB_PASSWORD') or ''}
+
+
+def tamanho_banco():
+    """Tamanho do banco em bytes (PostgreSQL), usado como estimativa de progresso."""
+    return db.session.execute(text('SELECT pg_database_size(current_database())')).scalar()
+
+
+def dump_postgres(compressao='gzip'):
+    """Inicia o `pg_dump` e devolve um gerador com os blocos do dump.
+
+    Erros de conexão ou autenticação são detectados antes do primeiro bloco
+    e levantam `ErroBackup`, para que a rota ainda possa responder com uma
+    mensagem em vez de um download corrompido.
+    """
+    comando = [
+        'pg_dump',
+        '-h', os.getenv('DB_HOST'),
+        '-p', os.getenv('DB_PORT'),
+        '-U', os.getenv('DB_USER'),
+        '-d', os.getenv('DB_NAME'),
+        '-F', 'c',
+        f'--compress={COMPRESSOES[compressao]}',
+    ]
+    try:
+        processo = subprocess.Popen(comando, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=_ambiente_pg())
+    except OSError as e:
+        raise ErroBackup(f'Não foi possível executar o pg_dump: {e}') from e
+
+    primeiro = processo.stdout.read(TAMANHO_BLOCO)
+    if not primeiro:
+        erro = processo.stderr.read().decode(errors='replace')
+        processo.wait()
+        raise ErroBackup(erro or 'pg_dump não gerou dados.')
+
+    def blocos():
+        try:
+            yield primeiro
+            while bloco := processo.stdout.read(TAMANHO_BLOCO):
+                yield bloco
+            if processo.wait() != 0:
+                # O download já começou: interrompe a resposta para não entregar um arquivo incompleto
+                erro = processo.stderr.read().decode(errors='replace')
+                log.error('pg_dump terminou com erro: %s', erro)
+                raise ErroBackup(erro)
+        finally:
+            if processo.poll() is None:
+                processo.kill()
+                processo.wait()
+            processo.stdout.close()
+            processo.stderr.close()
+
+    return blocos()
+
+
+class _Canal(io.RawIOBase):
+    """Arquivo só de escrita cujo conteúdo é retirado aos poucos pelo gerador."""
+
+    def __init__(self):
+        self.partes = []
+
+    def writable(self):
+        return True
+
+    def write(self, dados):
+        self.partes.append(bytes(dados))
+        return len(dados)
+
+    def retirar(self):
+        dados = b''.join(self.partes)
+        self.partes = []
+        return dados
+
+
+def snapshot_csv():
+    """Gera um .zip com um CSV por tabela, bloco a bloco."""
+    canal = _Canal()
+    with zipfile.ZipFile(canal, 'w', compression=zipfile.ZIP_DEFLATED) as arquivo_zip:
+        for tabela in db.metadata.sorted_tables:
+            with arquivo_zip.open(f'{tabela.name}.csv', 'w', force_zip64=True) as binario:
+                texto = io.TextIOWrapper(binario, encoding='utf-8', newline='')
+                escritor = csv.writer(texto)
+                escritor.writerow([coluna.name for coluna in tabela.columns])
+                resultado = db.session.execute(
+                    select(tabela).execution_options(stream_results=True, max_row_buffer=LINHAS_POR_BLOCO)
+                )
+                for bloco in resultado.partitions(LINHAS_POR_BLOCO):
+                    escritor.writerows(bloco)
+                    texto.flush()
+                    yield canal.retirar()
+                texto.flush()
+                texto.detach()
+            yield canal.retirar()
+    yield canal.retirar()
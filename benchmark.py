@@ -0,0 +1,150 @@
+"""Benchmark das telas principais pelo test client do Flask.
+
+Cada cenário é requisitado `--repeticoes` vezes (após `--aquecimento`
+requisições descartadas) contra o banco de DATABASE_URL, de preferência
+preenchido com `gerar_dados.py`. Para cada cenário são registrados os
+percentis da latência (p50/p95/p99), o número de comandos SQL e o tempo no
+banco (do cabeçalho `Server-Timing`, ver metricas.py) e o pico de memória
+Python de uma requisição (tracemalloc, em uma execução à parte para não
+distorcer os tempos).
+
+Os relatórios são medidos com o cache de relatórios vazio (`_sem_cache`) e
+aquecido.
+
+    python benchmark.py --salvar benchmark_base.json
+    python benchmark.py --comparar benchmark_base.json --tolerancia 20
+
+Com `--comparar`, o script termina com código 1 se o p95 de algum cenário
+piorar mais que `--tolerancia` por cento em relação à base.
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import sys
+import time
+import tracemalloc
+from __init__ import create_app
+import cache_relatorios
+
+CENARIOS = [
+    ('produtos', '/produtos', False),
+    ('produtos_busca', '/produtos?q=cabo', False),
+    ('saidas', '/saidas', False),
+    ('servicos', '/servicos', False),
+    ('caixa', '/caixa', False),
+    ('relatorios_dia', '/relatorios', False),
+    ('relatorios_mes', '/relatorios?mes_inteiro=1', False),
+    ('relatorios_ano', '/relatorios?ano_inteiro=1', False),
+    ('relatorios_dia_sem_cache', '/relatorios', True),
+    ('relatorios_mes_sem_cache', '/relatorios?mes_inteiro=1', True),
+    ('relatorios_ano_sem_cache', '/relatorios?ano_inteiro=1', True),
+    ('tendencia_12_meses', '/api/v1/relatorios/tendencia', False),
+    ('tendencia_30_dias', '/api/v1/relatorios/tendencia?granularidade=dia', False),
+]
+
+_SERVER_TIMING = re.compile(r'db;dur=([\d.]+);desc="(\d+) consultas"')
+
+
+def _percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, round(p / 100 * (len(ordenados) - 1)))]
+
+
+def _requisitar(cliente, url, sem_cache):
+    if sem_cache:
+        with cliente.application.app_context():
+            cache_relatorios.limpar()
+    inicio = time.perf_counter()
+    resposta = cliente.get(url)
+    duracao = (time.perf_counter() - inicio) * 1000
+    if resposta.status_code != 200:
+        sys.exit(f'{url} respondeu {resposta.status_code}')
+    banco, consultas = _SERVER_TIMING.search(resposta.headers.get('Server-Timing', '')).groups()
+    return duracao, float(banco), int(consultas)
+
+
+def medir(cliente, url, sem_cache, repeticoes, aquecimento):
+    for _ in range(aquecimento):
+        _requisitar(cliente, url, sem_cache)
+    latencias, tempos_banco, consultas = [], [], []
+    for _ in range(repeticoes):
+        duracao, banco, n = _requisitar(cliente, url, sem_cache)
+        latencias.append(duracao)
+        tempos_banco.append(banco)
+        consultas.append(n)
+
+    tracemalloc.start()
+    _requisitar(cliente, url, sem_cache)
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'p50_ms': round(_percentil(latencias, 50), 2),
+        'p95_ms': round(_percentil(latencias, 95), 2),
+        'p99_ms': round(_percentil(latencias, 99), 2),
+        'media_banco_ms': round(statistics.mean(tempos_banco), 2),
+        'consultas': max(consultas),
+        'pico_memoria_kb': round(pico / 1024),
+    }
+
+
+def comparar(resultados, base, tolerancia):
+    pioras = []
+    print(f'\n{"cenário":28} {"p95 base":>10} {"p95 atual":>10} {"variação":>9} {"consultas":>12}')
+    for nome, atual in resultados.items():
+        anterior = base.get(nome)
+        if anterior is None:
+            print(f'{nome:28} {"-":>10} {atual["p95_ms"]:>10.2f} {"novo":>9}')
+            continue
+        variacao = (atual['p95_ms'] - anterior['p95_ms']) / max(anterior['p95_ms'], 1e-9) * 100
+        consultas = f'{anterior["consultas"]} -> {atual["consultas"]}'
+        print(f'{nome:28} {anterior["p95_ms"]:>10.2f} {atual["p95_ms"]:>10.2f} {variacao:>+8.1f}% {consultas:>12}')
+        if variacao > tolerancia:
+            pioras.append(nome)
+    return pioras
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Mede a latência das telas principais.')
+    parser.add_argument('--repeticoes', type=int, default=30)
+    parser.add_argument('--aquecimento', type=int, default=3)
+    parser.add_argument('--cenarios', help='nomes separados por vírgula (padrão: todos)')
+    parser.add_argument('--salvar', help='grava os resultados neste arquivo JSON (nova base)')
+    parser.add_argument('--comparar', help='arquivo JSON da base para comparação')
+    parser.add_argument('--tolerancia', type=float, default=20, help='piora máxima aceita do p95, em %%')
+    args = parser.parse_args()
+
+    escolhidos = set(args.cenarios.split(',')) if args.cenarios else None
+    app = create_app()
+    cliente = app.test_client()
+    resposta = cliente.post('/login', data={'username': os.getenv('APP_USERNAME', 'admin'),
+                                            'password': os.getenv('APP_PASSWORD', 'smarttym2023')})
+    if resposta.status_code != 302:
+        sys.exit('Falha no login: confira APP_USERNAME e APP_PASSWORD.')
+
+    resultados = {}
+    print(f'{"cenário":28} {"p50":>8} {"p95":>8} {"p99":>8} {"banco":>8} {"consultas":>9} {"memória":>10}')
+    for nome, url, sem_cache in CENARIOS:
+        if escolhidos and nome not in escolhidos:
+            continue
+        r = medir(cliente, url, sem_cache, args.repeticoes, args.aquecimento)
+        resultados[nome] = r
+        print(f'{nome:28} {r["p50_ms"]:>8.2f} {r["p95_ms"]:>8.2f} {r["p99_ms"]:>8.2f} '
+              f'{r["media_banco_ms"]:>8.2f} {r["consultas"]:>9} {r["pico_memoria_kb"]:>7} KB')
+
+    if args.salvar:
+        with open(args.salvar, 'w') as arquivo:
+            json.dump(resultados, arquivo, indent=2)
+        print(f'\nResultados gravados em {args.salvar}')
+
+    if args.comparar:
+        with open(args.comparar) as arquivo:
+            pioras = comparar(resultados, json.load(arquivo), args.tolerancia)
+        if pioras:
+            sys.exit(f'\nPiora acima de {args.tolerancia}% no p95: {", ".join(pioras)}')
+
+
+if __name__ == '__main__':
+    main()
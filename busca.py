@@ -0,0 +1,80 @@
+"""Pesquisa de produtos por nome.
+
+A pesquisa usa `Produto.nome_busca` (nome em minúsculas e sem acentos), então
+"pelicula" encontra "Película". No PostgreSQL a coluna tem um índice GIN de
+trigramas (pg_trgm), que atende `LIKE '%termo%'` e a ordenação por
+similaridade. No SQLite (ambiente local e testes) é usada a tabela virtual
+FTS5 `produtos_fts` com tokenizador de trigramas. Os índices são criados pela
+migração `busca_produtos`; sem eles a pesquisa continua funcionando com LIKE.
+Se a extensão pg_trgm não puder ser instalada (exige privilégios no banco), os
+resultados são ordenados pelo tamanho do nome, como no SQLite sem FTS5.
+"""
+from sqlalchemy import column, func, inspect, literal_column, select, table, text
+from models import db, Produto
+from utils import normalizar_texto
+
+# O tokenizador de trigramas precisa de pelo menos 3 caracteres
+_MINIMO_TRIGRAMA = 3
+
+_fts = table('produtos_fts', column('rowid'), column('rank'))
+
+_fts_disponivel = {}
+_trgm_disponivel = {}
+
+
+def _dialeto():
+    return db.session.get_bind().dialect.name
+
+
+def _usar_fts(termo):
+    if _dialeto() != 'sqlite' or len(termo) < _MINIMO_TRIGRAMA:
+        return False
+    url = str(db.engine.url)
+    if url not in _fts_disponivel:
+        _fts_disponivel[url] = inspect(db.engine).has_table('produtos_fts')
+    return _fts_disponivel[url]
+
+
+def _usar_similaridade():
+    if _dialeto() != 'postgresql':
+        return False
+    url = str(db.engine.url)
+    if url not in _trgm_disponivel:
+        with db.engine.connect() as conexao:
+            _trgm_disponivel[url] = conexao.execute(
+                text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            ).scalar() is not None
+    return _trgm_disponivel[url]
+
+
+def _match(termo):
+    # Aspas fazem o FTS5 tratar o termo como texto literal
+    return literal_column('produtos_fts').op('MATCH')('"' + termo.replace('"', '""') + '"')
+
+
+def _like(termo):
+    termo = termo.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return Produto.nome_busca.like(f'%{termo}%', escape='\\')
+
+
+def filtro_busca(termo):
+    """Filtro de produtos cujo nome contém `termo`, ignorando maiúsculas e acentos."""
+    termo = normalizar_texto(termo)
+    if _usar_fts(termo):
+        return Produto.id.in_(select(_fts.c.rowid).where(_match(termo)))
+    return _like(termo)
+
+
+def buscar_produtos(termo, limite=10):
+    """Até `limite` produtos que correspondem a `termo`, os mais parecidos primeiro."""
+    termo = normalizar_texto(termo)
+    if _usar_fts(termo):
+        consulta = Produto.query.join(_fts, _fts.c.rowid == Produto.id).filter(_match(termo))
+        ordem = [_fts.c.rank, Produto.nome]
+    elif _usar_similaridade():
+        consulta = Produto.query.filter(_like(termo))
+        ordem = [func.similarity(Produto.nome_busca, termo).desc(), Produto.nome]
+    else:
+        consulta = Produto.query.filter(_like(termo))
+        ordem = [func.length(Produto.nome_busca), Produto.nome]
+    return consulta.order_by(*ordem).limit(limite).all()
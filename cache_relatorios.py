@@ -0,0 +1,136 @@
+"""Cache dos relatórios por período, compartilhado entre os workers.
+
+Os resultados ficam em um arquivo SQLite local (um por banco de dados), com
+no máximo `MAXIMO_ENTRADAS` períodos; os menos usados recentemente são
+descartados. Quando uma gravação confirmada altera um dia, os períodos que
+contêm esse dia são removidos (ver `resumo.py`).
+
+Cada invalidação também é anotada por dia ('*' quando o cache todo é
+limpo). Um resultado calculado antes da última invalidação de algum dia do
+seu período não é guardado, pois pode ter lido dados anteriores àquela
+gravação.
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import time
+from contextlib import contextmanager
+from models import db
+
+MAXIMO_ENTRADAS = 500
+
+log = logging.getLogger(__name__)
+
+_preparados = set()
+
+
+def _caminho():
+    caminho = os.getenv('RELATORIOS_CACHE_PATH')
+    if caminho:
+        return caminho
+    banco = hashlib.sha1(str(db.engine.url).encode()).hexdigest()[:12]
+    return os.path.join(tempfile.gettempdir(), f'smart_finance_relatorios_{banco}.sqlite')
+
+
+@contextmanager
+def _conectar():
+    caminho = _caminho()
+    conexao = sqlite3.connect(caminho, timeout=5, isolation_level=None)
+    try:
+        _preparar(conexao, caminho)
+        yield conexao
+    finally:
+        conexao.close()
+
+
+def _preparar(conexao, caminho):
+    if caminho not in _preparados:
+        conexao.execute('PRAGMA journal_mode=WAL')
+        conexao.execute(
+            'CREATE TABLE IF NOT EXISTS relatorios ('
+            ' inicio TEXT, fim TEXT, dados TEXT NOT NULL, usado_em REAL NOT NULL,'
+            ' PRIMARY KEY (inicio, fim))'
+        )
+        conexao.execute('CREATE INDEX IF NOT EXISTS ix_relatorios_usado_em ON relatorios (usado_em)')
+        conexao.execute('CREATE TABLE IF NOT EXISTS invalidacoes (dia TEXT PRIMARY KEY, em REAL NOT NULL)')
+        _preparados.add(caminho)
+
+
+def obter(inicio, fim):
+    """Resultado guardado para o período [inicio, fim), ou None."""
+    try:
+        with _conectar() as conexao:
+            linha = conexao.execute(
+                'SELECT dados FROM relatorios WHERE inicio = ? AND fim = ?', (inicio.isoformat(), fim.isoformat())
+            ).fetchone()
+            if linha is None:
+                return None
+            conexao.execute(
+                'UPDATE relatorios SET usado_em = ? WHERE inicio = ? AND fim = ?',
+                (time.time(), inicio.isoformat(), fim.isoformat()),
+            )
+            return json.loads(linha[0])
+    except sqlite3.Error:
+        log.warning('Cache de relatórios indisponível', exc_info=True)
+        return None
+
+
+def guardar(inicio, fim, dados, calculado_em):
+    """Guarda o resultado de um período calculado a partir do instante `calculado_em`."""
+    try:
+        with _conectar() as conexao:
+            conexao.execute('BEGIN IMMEDIATE')
+            alterado = conexao.execute(
+                "SELECT 1 FROM invalidacoes WHERE ((dia >= ? AND dia < ?) OR dia = '*') AND em >= ? LIMIT 1",
+                (inicio.isoformat(), fim.isoformat(), calculado_em),
+            ).fetchone()
+            if not alterado:
+                conexao.execute(
+                    'INSERT OR REPLACE INTO relatorios (inicio, fim, dados, usado_em) VALUES (?, ?, ?, ?)',
+                    (inicio.isoformat(), fim.isoformat(), json.dumps(dados), time.time()),
+                )
+                conexao.execute(
+                    'DELETE FROM relatorios WHERE rowid NOT IN '
+                    '(SELECT rowid FROM relatorios ORDER BY usado_em DESC LIMIT ?)',
+                    (MAXIMO_ENTRADAS,),
+                )
+            conexao.execute('COMMIT')
+    except sqlite3.Error:
+        log.warning('Cache de relatórios indisponível', exc_info=True)
+
+
+def invalidar(dias):
+    """Remove os períodos que contêm algum dos `dias`."""
+    agora = time.time()
+    try:
+        with _conectar() as conexao:
+            conexao.execute('BEGIN IMMEDIATE')
+            for dia in dias:
+                conexao.execute('INSERT OR REPLACE INTO invalidacoes (dia, em) VALUES (?, ?)', (dia.isoformat(), agora))
+                conexao.execute(
+                    'DELETE FROM relatorios WHERE inicio <= ? AND fim > ?', (dia.isoformat(), dia.isoformat())
+                )
+            conexao.execute('COMMIT')
+    except sqlite3.Error:
+        log.warning('Cache de relatórios indisponível', exc_info=True)
+        limpar()
+
+
+def limpar():
+    """Descarta todo o cache (após reconstruir o resumo ou restaurar um backup)."""
+    try:
+        with _conectar() as conexao:
+            conexao.execute('BEGIN IMMEDIATE')
+            conexao.execute("INSERT OR REPLACE INTO invalidacoes (dia, em) VALUES ('*', ?)", (time.time(),))
+            conexao.execute('DELETE FROM relatorios')
+            conexao.execute('COMMIT')
+    except sqlite3.Error:
+        # Sem conseguir limpar, remove o arquivo para não servir dados antigos
+        log.error('Não foi possível limpar o cache de relatórios', exc_info=True)
+        for sufixo in ('', '-wal', '-shm'):
+            if os.path.exists(_caminho() + sufixo):
+                os.remove(_caminho() + sufixo)
+        _preparados.discard(_caminho())
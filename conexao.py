@@ -0,0 +1,115 @@
+"""Pool de conexões e resiliência do acesso ao banco.
+
+As opções do engine vêm do ambiente (.env):
+
+- `DB_POOL_SIZE`, `DB_MAX_OVERFLOW`, `DB_POOL_TIMEOUT`: tamanho do pool por
+  worker, conexões extras em picos e espera (s) por uma conexão livre;
+- `DB_POOL_RECYCLE`: idade máxima (s) de uma conexão, abaixo do tempo em que o
+  Postgres gerenciado derruba conexões ociosas;
+- `DB_POOL_PRE_PING`: testa a conexão antes de usá-la (padrão: ligado);
+- `DB_CONNECT_TIMEOUT`: espera (s) para abrir uma conexão;
+- `DB_PGBOUNCER`: compatível com o PgBouncer em modo transação. O pool passa a
+  ser o do PgBouncer (sem pool no worker) e nada é configurado na sessão do
+  Postgres, só dentro de cada transação;
+- `DB_STATEMENT_TIMEOUT`: tempo máximo (ms) de cada comando SQL durante uma
+  requisição (`SET LOCAL`, 0 desliga), para que um relatório descontrolado
+  não prenda o worker.
+
+Telas somente leitura usam `repetir_leitura`, que repete a requisição com
+espera crescente quando a conexão cai no meio dela.
+"""
+import logging
+import os
+import time
+from functools import wraps
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import NullPool
+from models import db
+
+TENTATIVAS = 3
+ESPERA_INICIAL = 0.2  # segundos, dobra a cada tentativa
+
+# Classes de erro do Postgres que indicam falha passageira: conexão (08),
+# conflito de transação (40) e servidor reiniciando (57P01-57P03)
+CODIGOS_TRANSITORIOS = ('08', '40', '57P01', '57P02', '57P03')
+
+log = logging.getLogger(__name__)
+
+
+def _env_int(nome, padrao):
+    valor = os.getenv(nome)
+    return int(valor) if valor else padrao
+
+
+def _env_bool(nome, padrao=False):
+    valor = os.getenv(nome)
+    return valor.lower() in ('1', 'true', 'sim') if valor else padrao
+
+
+def opcoes_engine(url):
+    """SQLALCHEMY_ENGINE_OPTIONS a partir das variáveis de ambiente."""
+    if not url or url.startswith('sqlite'):
+        return {}
+    opcoes = {
+        'pool_pre_ping': _env_bool('DB_POOL_PRE_PING', True),
+        'pool_recycle': _env_int('DB_POOL_RECYCLE', 300),
+        'connect_args': {'connect_timeout': _env_int('DB_CONNECT_TIMEOUT', 10)},
+    }
+    if _env_bool('DB_PGBOUNCER'):
+        opcoes['poolclass'] = NullPool
+    else:
+        opcoes.update(
+            pool_size=_env_int('DB_POOL_SIZE', 5),
+            max_overflow=_env_int('DB_MAX_OVERFLOW', 10),
+            pool_timeout=_env_int('DB_POOL_TIMEOUT', 30),
+        )
+    return opcoes
+
+
+def tempo_limite(ms):
+    """Decorator: tempo máximo (ms) dos comandos SQL da view; 0 desliga (exportações, backups)."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            g.tempo_limite_sql = ms
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@event.listens_for(Session, 'after_begin')
+def _aplicar_tempo_limite(sessao, transacao, conexao):
+    # SET LOCAL vale só até o fim da transação, então funciona com o PgBouncer em modo transação
+    if not has_request_context() or conexao.dialect.name != 'postgresql':
+        return
+    ms = g.get('tempo_limite_sql', current_app.config.get('DB_STATEMENT_TIMEOUT'))
+    if ms:
+        conexao.exec_driver_sql(f'SET LOCAL statement_timeout = {int(ms)}')
+
+
+def _transitorio(erro):
+    if erro.connection_invalidated:
+        return True
+    codigo = getattr(erro.orig, 'pgcode', None) or ''
+    return codigo.startswith(CODIGOS_TRANSITORIOS)
+
+
+def repetir_leitura(view):
+    """Decorator: repete GETs que falharam por um erro passageiro do banco."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if request.method != 'GET':
+            return view(*args, **kwargs)
+        for tentativa in range(TENTATIVAS):
+            try:
+                return view(*args, **kwargs)
+            except OperationalError as e:
+                if tentativa == TENTATIVAS - 1 or not _transitorio(e):
+                    raise
+                log.warning('Erro passageiro do banco em %s (tentativa %d): %s', request.path, tentativa + 1, e.orig)
+                db.session.rollback()
+                time.sleep(ESPERA_INICIAL * 2 ** tentativa)
+    return wrapper
@@ -0,0 +1,66 @@
+"""Consultas das listagens, compartilhadas pelas telas HTML e pela API JSON.
+
+Cada função aplica os filtros do recurso e pagina por cursor na ordem do seu
+índice composto. O produto das entradas e saídas é carregado na mesma
+consulta (JOIN), sem uma consulta extra por linha.
+"""
+from sqlalchemy.orm import joinedload
+from models import Produto, Entrada, Saida, Servico, Caixa
+from paginacao import paginar
+from busca import filtro_busca
+from utils import filtros_data
+
+POR_PAGINA = 20
+
+
+def filtros_produtos(q=None):
+    return [filtro_busca(q)] if q else []
+
+
+def listar_produtos(cursor=None, por_pagina=POR_PAGINA, q=None):
+    consulta = Produto.query.filter(*filtros_produtos(q))
+    return paginar(consulta, [Produto.nome, Produto.id], cursor, por_pagina)
+
+
+def listar_entradas(cursor=None, por_pagina=POR_PAGINA, produto_id=None, dia=None, mes=None, ano=None):
+    consulta = Entrada.query.options(joinedload(Entrada.produto)).filter(
+        *filtros_data(Entrada, 'data', dia, mes, ano)
+    )
+    if produto_id:
+        consulta = consulta.filter(Entrada.produto_id == produto_id)
+    return paginar(consulta, [Entrada.data, Entrada.id], cursor, por_pagina, desc=True)
+
+
+def listar_saidas(cursor=None, por_pagina=POR_PAGINA, produto_id=None, pagamento=None, cliente=None,
+                  dia=None, mes=None, ano=None):
+    consulta = Saida.query.options(joinedload(Saida.produto)).filter(
+        *filtros_data(Saida, 'data', dia, mes, ano)
+    )
+    if produto_id:
+        consulta = consulta.filter(Saida.produto_id == produto_id)
+    if pagamento:
+        consulta = consulta.filter(Saida.pagamento_codigo == pagamento)
+    if cliente:
+        consulta = consulta.filter(Saida.cliente == cliente)
+    return paginar(consulta, [Saida.data, Saida.id], cursor, por_pagina, desc=True)
+
+
+def listar_servicos(cursor=None, por_pagina=POR_PAGINA, status=None, tipo=None, subtipo=None, pagamento=None,
+                    dia=None, mes=None, ano=None):
+    consulta = Servico.query.filter(*filtros_data(Servico, 'data_hora', dia, mes, ano))
+    if status:
+        consulta = consulta.filter(Servico.status == status)
+    if tipo:
+        consulta = consulta.filter(Servico.tipo == tipo)
+    if subtipo:
+        consulta = consulta.filter(Servico.subtipo == subtipo)
+    if pagamento:
+        consulta = consulta.filter(Servico.pagamento_codigo == pagamento)
+    return paginar(consulta, [Servico.data_hora, Servico.id], cursor, por_pagina, desc=True)
+
+
+def listar_caixa(cursor=None, por_pagina=POR_PAGINA, tipo=None, dia=None, mes=None, ano=None):
+    consulta = Caixa.query.filter(*filtros_data(Caixa, 'data', dia, mes, ano))
+    if tipo:
+        consulta = consulta.filter(Caixa.tipo == tipo)
+    return paginar(consulta, [Caixa.data, Caixa.id], cursor, por_pagina, desc=True)
@@ -0,0 +1,103 @@
+"""Teste de estresse da movimentação de estoque concorrente.
+
+Vários workers (threads, cada uma com sua conexão e transação) vendem e repõem
+o mesmo produto ao mesmo tempo pelo `inventario.movimentar`. Ao final o
+estoque precisa ser exatamente o esperado (nenhuma atualização perdida) e o
+valor do inventário precisa bater com a soma do catálogo. Em seguida o mesmo
+produto é disputado com o bloqueio de estoque negativo ativo: as vendas aceitas
+não podem passar do estoque disponível.
+
+Use com o banco de produção desligado ou com uma cópia (DATABASE_URL); o
+produto de teste é removido no final.
+
+    python estresse_estoque.py [workers] [operacoes_por_worker]
+"""
+import sys
+import threading
+from __init__ import create_app
+from models import db, Produto
+import inventario
+
+workers = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+operacoes = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+app = create_app()
+
+
+def em_paralelo(tarefa):
+    barreira = threading.Barrier(workers)
+    resultados = [None] * workers
+
+    def executar(indice):
+        with app.app_context():
+            barreira.wait()
+            resultados[indice] = tarefa()
+
+    threads = [threading.Thread(target=executar, args=(i,)) for i in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return resultados
+
+
+def repor_e_vender():
+    for _ in range(operacoes):
+        inventario.movimentar(produto_id, 2)
+        db.session.commit()
+        inventario.movimentar(produto_id, -1)
+        db.session.commit()
+
+
+def vender_tudo():
+    vendidas = 0
+    for _ in range(operacoes):
+        try:
+            inventario.movimentar(produto_id, -1)
+            db.session.commit()
+            vendidas += 1
+        except inventario.EstoqueInsuficiente:
+            db.session.rollback()
+    return vendidas
+
+
+def conferir(descricao, esperado):
+    db.session.expire_all()
+    estoque = db.session.get(Produto, produto_id).estoque
+    custo, valor = inventario.valor_estoque()
+    custo_real, valor_real = inventario._somar_produtos()
+    erros = []
+    if estoque != esperado:
+        erros.append(f'estoque {estoque}, esperado {esperado}')
+    if abs(custo - custo_real) > 0.01 or abs(valor - valor_real) > 0.01:
+        erros.append(f'valor do inventário ({custo:.2f}/{valor:.2f}) difere do catálogo ({custo_real:.2f}/{valor_real:.2f})')
+    print(f"{descricao}: {'OK' if not erros else 'FALHOU - ' + '; '.join(erros)}")
+    return not erros
+
+
+with app.app_context():
+    produto = Produto(nome='__estresse_estoque__', tipo='Produto', preco_venda=10.0, custo=4.0, estoque=0)
+    inventario.adicionar_produto(produto)
+    db.session.commit()
+    produto_id = produto.id
+
+    try:
+        em_paralelo(repor_e_vender)
+        sucesso = conferir(f'{workers} workers x {operacoes} reposições e vendas', workers * operacoes)
+
+        disponivel = workers * operacoes // 2
+        inventario.movimentar(produto_id, disponivel - workers * operacoes)
+        db.session.commit()
+        app.config['BLOQUEAR_ESTOQUE_NEGATIVO'] = True
+        vendidas = sum(em_paralelo(vender_tudo))
+        app.config['BLOQUEAR_ESTOQUE_NEGATIVO'] = False
+        sucesso = conferir(f'{workers * operacoes} vendas para {disponivel} unidades ({vendidas} aceitas)', 0) and sucesso
+        if vendidas != disponivel:
+            print(f'Vendas aceitas: {vendidas}, esperado {disponivel}')
+            sucesso = False
+    finally:
+        db.session.rollback()
+        inventario.remover_produto(db.session.get(Produto, produto_id))
+        db.session.commit()
+
+sys.exit(0 if sucesso else 1)
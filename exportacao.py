@@ -0,0 +1,95 @@
+"""Exportação em CSV de vendas, serviços, entradas e caixa por período.
+
+As linhas são lidas do banco em blocos (`yield_per`, cursor do lado do
+servidor no PostgreSQL) e enviadas ao navegador à medida que são lidas, então
+a memória usada não depende do tamanho do período e o download começa antes
+de a consulta terminar. Opcionalmente o CSV é compactado em gzip no caminho.
+"""
+import csv
+import io
+import zlib
+from datetime import timezone
+from sqlalchemy import select
+from models import db, Produto, Entrada, Saida, Servico, Caixa
+from utils import TZ_LOJA, intervalo_utc
+
+LINHAS_POR_BLOCO = 1000
+
+# recurso -> (modelo, coluna de data, [(cabeçalho, coluna)])
+RECURSOS = {
+    'saidas': (Saida, Saida.data, [
+        ('id', Saida.id), ('data', Saida.data), ('produto_id', Saida.produto_id), ('produto', Produto.nome),
+        ('quantidade', Saida.quantidade), ('preco_unitario', Saida.preco_unitario),
+        ('custo_unitario', Saida.custo_unitario), ('total_venda', Saida.total_venda),
+        ('forma_pagamento', Saida.forma_pagamento), ('pagamento_codigo', Saida.pagamento_codigo),
+        ('cliente', Saida.cliente), ('venda_id', Saida.venda_id),
+    ]),
+    'entradas': (Entrada, Entrada.data, [
+        ('id', Entrada.id), ('data', Entrada.data), ('produto_id', Entrada.produto_id), ('produto', Produto.nome),
+        ('quantidade', Entrada.quantidade), ('custo_unitario', Entrada.custo_unitario),
+        ('total_custo', Entrada.total_custo),
+    ]),
+    'servicos': (Servico, Servico.data_hora, [
+        ('id', Servico.id), ('data_hora', Servico.data_hora), ('servico_descricao', Servico.servico_descricao),
+        ('aparelho', Servico.aparelho), ('tipo', Servico.tipo), ('subtipo', Servico.subtipo),
+        ('custo_pecas', Servico.custo_pecas),
+        ('mao_de_obra', Servico.mao_de_obra), ('preco_aparelho', Servico.preco_aparelho),
+        ('status', Servico.status), ('forma_pagamento', Servico.forma_pagamento),
+        ('pagamento_codigo', Servico.pagamento_codigo), ('cliente', Servico.cliente),
+    ]),
+    'caixa': (Caixa, Caixa.data, [
+        ('id', Caixa.id), ('data', Caixa.data), ('tipo', Caixa.tipo), ('valor', Caixa.valor),
+        ('descricao', Caixa.descricao), ('saldo', Caixa.saldo), ('origem_tipo', Caixa.origem_tipo),
+        ('origem_id', Caixa.origem_id),
+    ]),
+}
+
+
+def _hora_local(dt):
+    return dt.replace(tzinfo=timezone.utc).astimezone(TZ_LOJA).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _consulta(recurso, inicio, fim):
+    model, coluna_data, colunas = RECURSOS[recurso]
+    consulta = select(*[coluna for _, coluna in colunas])
+    if model in (Saida, Entrada):
+        consulta = consulta.join(Produto, Produto.id == model.produto_id)
+    desde, ate = intervalo_utc(inicio, fim)
+    return (
+        consulta.where(coluna_data >= desde, coluna_data < ate)
+        .order_by(coluna_data, model.id)
+        .execution_options(yield_per=LINHAS_POR_BLOCO)
+    )
+
+
+def linhas_csv(recurso, inicio, fim, separador=','):
+    """Gera o CSV do `recurso` no intervalo de datas locais [inicio, fim), um bloco de texto por vez."""
+    _, _, colunas = RECURSOS[recurso]
+    posicoes_data = [i for i, (_, coluna) in enumerate(colunas) if coluna.key in ('data', 'data_hora')]
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer, delimiter=separador)
+
+    escritor.writerow([cabecalho for cabecalho, _ in colunas])
+    yield buffer.getvalue()
+
+    resultado = db.session.execute(_consulta(recurso, inicio, fim))
+    for bloco in resultado.partitions():
+        buffer.seek(0)
+        buffer.truncate()
+        for linha in bloco:
+            linha = list(linha)
+            for i in posicoes_data:
+                if linha[i] is not None:
+                    linha[i] = _hora_local(linha[i])
+            escritor.writerow(linha)
+        yield buffer.getvalue()
+
+
+def compactar(blocos):
+    """Compacta em gzip, sob demanda, os blocos de texto gerados por `linhas_csv`."""
+    compressor = zlib.compressobj(wbits=31)  # 31 = formato gzip
+    for bloco in blocos:
+        dados = compressor.compress(bloco.encode('utf-8'))
+        if dados:
+            yield dados
+    yield compressor.flush()
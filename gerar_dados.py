@@ -0,0 +1,214 @@
+"""Gera dados sintéticos em volume de produção para testes de desempenho.
+
+Preenche produtos, entradas, saídas, serviços e caixa com valores plausíveis,
+espalhados pelos últimos anos em ordem cronológica (como em uso real: ids
+crescem com a data). Os registros são inseridos em lotes de `LOTE` linhas com
+INSERTs de várias linhas; no final o saldo do caixa, o valor do estoque e o
+resumo diário são recalculados. Funciona com PostgreSQL e SQLite (DATABASE_URL).
+
+Por segurança só roda em um banco sem produtos, a não ser com `--apagar`, que
+remove TODOS os dados antes de gerar os novos.
+
+    python gerar_dados.py                       # volume padrão (ver VOLUMES)
+    python gerar_dados.py --escala 0.01         # 1% do volume padrão
+    python gerar_dados.py --saidas 100000 --anos 2 --semente 7
+"""
+import argparse
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import insert
+from __init__ import create_app
+from models import db, Produto, Entrada, Saida, Servico, Caixa, SaldoCaixa, Migracao
+from migrations import aplicar_migracoes
+from inventario import recalcular_valor_estoque
+from resumo import reconstruir_resumo
+from utils import normalizar_pagamento, normalizar_texto
+
+LOTE = 10000
+
+VOLUMES = {
+    'produtos': 50_000,
+    'entradas': 200_000,
+    'saidas': 2_000_000,
+    'servicos': 500_000,
+    'caixa': 3_000_000,
+}
+
+CATEGORIAS = ['Capa', 'Película', 'Carregador', 'Cabo USB-C', 'Cabo Lightning', 'Fone', 'Bateria',
+              'Tela', 'Conector de Carga', 'Caixa de Som', 'Suporte Veicular', 'Cartão de Memória']
+MARCAS = ['Samsung', 'Motorola', 'Xiaomi', 'iPhone', 'LG', 'Asus', 'Realme', 'Nokia']
+MODELOS = ['A10', 'A32', 'A54', 'G8', 'G22', 'Redmi 9', 'Note 11', '11', '13 Pro', 'K10', 'Zenfone 5', 'C55']
+REPAROS = ['Troca de tela', 'Troca de bateria', 'Troca de conector', 'Reparo na placa', 'Desoxidação',
+           'Troca de câmera', 'Troca de alto-falante', 'Atualização de software']
+CLIENTES = ['Ana', 'Bruno', 'Carla', 'Diego', 'Eduarda', 'Felipe', 'Gabriela', 'Hugo', 'Isabela', 'João',
+            'Larissa', 'Marcos', 'Natália', 'Otávio', 'Paula', 'Rafael', 'Sabrina', 'Tiago', 'Vanessa', '']
+# Forma de pagamento -> peso
+FORMAS = {'Dinheiro': 30, 'Pix': 40, 'Crédito': 15, 'Débito': 15}
+
+
+def _datas(n, inicio, fim):
+    """Lotes de datas em ordem crescente cobrindo [inicio, fim)."""
+    passo = (fim - inicio) / max(n, 1)
+    for i in range(0, n, LOTE):
+        k = min(LOTE, n - i)
+        base = inicio + passo * i
+        yield sorted(base + passo * k * random.random() for _ in range(k))
+
+
+def _forma():
+    return random.choices(list(FORMAS), weights=list(FORMAS.values()))[0]
+
+
+def _inserir(model, lotes, total):
+    inicio = time.perf_counter()
+    for linhas in lotes:
+        db.session.execute(insert(model), linhas)
+        db.session.commit()
+    duracao = time.perf_counter() - inicio
+    print(f'{model.__tablename__}: {total} linhas em {duracao:.1f}s ({total / max(duracao, 1e-9):.0f} linhas/s)')
+
+
+def gerar_produtos(n):
+    def lotes():
+        for i in range(0, n, LOTE):
+            linhas = []
+            for j in range(i, min(i + LOTE, n)):
+                nome = f'{random.choice(CATEGORIAS)} {random.choice(MARCAS)} {random.choice(MODELOS)} #{j + 1}'
+                custo = round(random.uniform(3, 400), 2)
+                linhas.append({'nome': nome, 'nome_busca': normalizar_texto(nome), 'tipo': 'Produto',
+                               'custo': custo, 'preco_venda': round(custo * random.uniform(1.3, 3), 2),
+                               'estoque': random.randint(0, 200)})
+            yield linhas
+    _inserir(Produto, lotes(), n)
+    return db.session.query(Produto.id, Produto.custo, Produto.preco_venda).all()
+
+
+def gerar_entradas(n, produtos, inicio, fim):
+    def lotes():
+        for datas in _datas(n, inicio, fim):
+            linhas = []
+            for data in datas:
+                produto = random.choice(produtos)
+                quantidade = random.randint(1, 50)
+                linhas.append({'data': data, 'produto_id': produto.id, 'quantidade': quantidade,
+                               'custo_unitario': produto.custo, 'total_custo': quantidade * produto.custo})
+            yield linhas
+    _inserir(Entrada, lotes(), n)
+
+
+def gerar_saidas(n, produtos, inicio, fim):
+    def lotes():
+        for datas in _datas(n, inicio, fim):
+            linhas = []
+            for data in datas:
+                produto = random.choice(produtos)
+                quantidade = random.choices([1, 2, 3, 5], weights=[80, 12, 5, 3])[0]
+                forma = _forma()
+                linhas.append({'data': data, 'produto_id': produto.id, 'quantidade': quantidade,
+                               'preco_unitario': produto.preco_venda, 'custo_unitario': produto.custo,
+                               'total_venda': quantidade * produto.preco_venda, 'forma_pagamento': forma,
+                               'pagamento_codigo': normalizar_pagamento(forma), 'cliente': random.choice(CLIENTES)})
+            yield linhas
+    _inserir(Saida, lotes(), n)
+
+
+def gerar_servicos(n, inicio, fim):
+    def lotes():
+        for datas in _datas(n, inicio, fim):
+            linhas = []
+            for data in datas:
+                aparelho = f'{random.choice(MARCAS)} {random.choice(MODELOS)}'
+                custo_pecas = round(random.uniform(0, 300), 2)
+                if random.random() < 0.8:
+                    tipo, subtipo, descricao = 'Manutenção', 'Manutenção', random.choice(REPAROS)
+                    mao_de_obra, preco_aparelho = round(random.uniform(40, 250), 2), 0.0
+                else:
+                    tipo, mao_de_obra = 'Venda de Aparelho', 0.0
+                    subtipo = random.choice(['Reforma', 'Revenda'])
+                    descricao = 'Revenda de Aparelho' if subtipo == 'Revenda' else 'Venda de Aparelho'
+                    preco_aparelho = round(custo_pecas + random.uniform(200, 1500), 2)
+                # Serviços recentes ainda podem estar em andamento
+                status = 'Iniciado' if data > fim - timedelta(days=7) and random.random() < 0.5 else 'Finalizado'
+                forma = _forma()
+                linhas.append({'data_hora': data, 'servico_descricao': descricao, 'aparelho': aparelho, 'tipo': tipo,
+                               'subtipo': subtipo, 'custo_pecas': custo_pecas, 'mao_de_obra': mao_de_obra,
+                               'preco_aparelho': preco_aparelho, 'status': status, 'forma_pagamento': forma,
+                               'pagamento_codigo': normalizar_pagamento(forma), 'cliente': random.choice(CLIENTES)})
+            yield linhas
+    _inserir(Servico, lotes(), n)
+
+
+def gerar_caixa(n, inicio, fim):
+    saldo = 0.0
+
+    def lotes():
+        nonlocal saldo
+        for datas in _datas(n, inicio, fim):
+            linhas = []
+            for data in datas:
+                if saldo > 50 and random.random() < 0.3:
+                    tipo, valor = 'Retirada', round(random.uniform(10, min(saldo, 500)), 2)
+                    descricao = random.choice(['Sangria', 'Pagamento de fornecedor', 'Troco', 'Despesas'])
+                    saldo -= valor
+                else:
+                    tipo, valor = 'Entrada', round(random.uniform(10, 400), 2)
+                    descricao = random.choice(['Aporte', 'Venda avulsa', 'Recebimento'])
+                    saldo += valor
+                linhas.append({'data': data, 'tipo': tipo, 'valor': valor, 'descricao': descricao,
+                               'saldo': round(saldo, 2)})
+            yield linhas
+    _inserir(Caixa, lotes(), n)
+    db.session.query(SaldoCaixa).delete()
+    db.session.add(SaldoCaixa(id=1, saldo=round(saldo, 2)))
+    db.session.commit()
+
+
+def apagar_dados():
+    for tabela in reversed(db.metadata.sorted_tables):
+        if tabela.name != Migracao.__tablename__:
+            db.session.execute(tabela.delete())
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Gera dados sintéticos para testes de desempenho.')
+    for tabela, padrao in VOLUMES.items():
+        parser.add_argument(f'--{tabela}', type=int, help=f'quantidade de linhas (padrão: {padrao})')
+    parser.add_argument('--escala', type=float, default=1.0, help='multiplica os volumes padrão')
+    parser.add_argument('--anos', type=float, default=3, help='período coberto, até hoje')
+    parser.add_argument('--semente', type=int, default=42, help='semente do gerador aleatório')
+    parser.add_argument('--apagar', action='store_true', help='apaga TODOS os dados existentes antes')
+    args = parser.parse_args()
+
+    volumes = {tabela: getattr(args, tabela) if getattr(args, tabela) is not None else int(padrao * args.escala)
+               for tabela, padrao in VOLUMES.items()}
+    volumes['produtos'] = max(volumes['produtos'], 1)
+    random.seed(args.semente)
+    fim = datetime.now(timezone.utc).replace(tzinfo=None)
+    inicio = fim - timedelta(days=365 * args.anos)
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        aplicar_migracoes()
+        if args.apagar:
+            apagar_dados()
+        elif db.session.query(Produto.id).first():
+            sys.exit('O banco já tem produtos. Use --apagar para substituir TODOS os dados.')
+
+        produtos = gerar_produtos(volumes['produtos'])
+        gerar_entradas(volumes['entradas'], produtos, inicio, fim)
+        gerar_saidas(volumes['saidas'], produtos, inicio, fim)
+        gerar_servicos(volumes['servicos'], inicio, fim)
+        gerar_caixa(volumes['caixa'], inicio, fim)
+
+        recalcular_valor_estoque()
+        db.session.commit()
+        dias = reconstruir_resumo()
+        print(f'Resumo diário reconstruído ({dias} dias).')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+"""Importação em lote de entradas de estoque a partir de CSV.
+
+Colunas (cabeçalho obrigatório, separador `,` ou `;`):
+
+- `nome` ou `produto_id`: produto da entrada; nomes são comparados sem
+  acentos nem maiúsculas e produtos desconhecidos são criados;
+- `quantidade` e `custo_unitario`: obrigatórios;
+- `preco_venda`: obrigatório para produtos novos; em produtos existentes
+  atualiza o preço de venda.
+
+O arquivo é lido linha a linha e processado em lotes de `TAMANHO_LOTE`: uma
+consulta resolve os produtos do lote, as entradas são inseridas com um único
+INSERT de várias linhas (executemany) e o estoque recebe um único UPDATE.
+Linhas inválidas não interrompem a importação; cada uma gera um erro com o
+número da linha no arquivo.
+"""
+import csv
+import io
+from datetime import datetime, timezone
+from sqlalchemy import insert
+from models import db, Produto, Entrada
+from utils import data_local, normalizar_texto
+import inventario
+import resumo
+
+TAMANHO_LOTE = 500
+
+
+class ResultadoImportacao:
+    def __init__(self):
+        self.importadas = 0
+        self.produtos_criados = 0
+        self.erros = []  # (linha, mensagem)
+
+
+def _numero(texto, campo, inteiro=False):
+    texto = (texto or '').strip()
+    if not texto:
+        raise ValueError(f'{campo} não informado')
+    # Aceita o formato brasileiro: 1.234,56
+    if ',' in texto:
+        texto = texto.replace('.', '').replace(',', '.')
+    try:
+        valor = float(texto)
+    except ValueError:
+        raise ValueError(f'{campo} inválido: {texto}') from None
+    if inteiro:
+        if not valor.is_integer():
+            raise ValueError(f'{campo} deve ser um número inteiro: {texto}')
+        valor = int(valor)
+    if valor < 0 or (inteiro and valor == 0):
+        raise ValueError(f'{campo} deve ser positivo: {texto}')
+    return valor
+
+
+def _ler_linha(linha):
+    produto_id = (linha.get('produto_id') or '').strip()
+    nome = (linha.get('nome') or '').strip()
+    if not produto_id and not nome:
+        raise ValueError('informe nome ou produto_id')
+    preco_venda = linha.get('preco_venda')
+    return {
+        'produto_id': _numero(produto_id, 'produto_id', inteiro=True) if produto_id else None,
+        'nome': nome,
+        'quantidade': _numero(linha.get('quantidade'), 'quantidade', inteiro=True),
+        'custo_unitario': _numero(linha.get('custo_unitario'), 'custo_unitario'),
+        'preco_venda': _numero(preco_venda, 'preco_venda') if (preco_venda or '').strip() else None,
+    }
+
+
+def _leitor(arquivo):
+    """DictReader sobre um arquivo binário, detectando o separador pelo cabeçalho."""
+    texto = io.TextIOWrapper(arquivo, encoding='utf-8-sig', newline='')
+    cabecalho = texto.readline()
+    separador = ';' if cabecalho.count(';') > cabecalho.count(',') else ','
+    campos = [c.strip().lower() for c in next(csv.reader([cabecalho], delimiter=separador), [])]
+    return csv.DictReader(texto, fieldnames=campos, delimiter=separador)
+
+
+def _processar_lote(lote, momento, resultado):
+    ids = {dados['produto_id'] for _, dados in lote if dados['produto_id']}
+    nomes = {normalizar_texto(dados['nome']) for _, dados in lote if not dados['produto_id']}
+    por_id = {p.id: p for p in Produto.query.filter(Produto.id.in_(ids))} if ids else {}
+    por_nome = {p.nome_busca: p for p in Produto.query.filter(Produto.nome_busca.in_(nomes))} if nomes else {}
+
+    entradas = []
+    quantidades = {}
+    for numero, dados in lote:
+        if dados['produto_id']:
+            produto = por_id.get(dados['produto_id'])
+            if produto is None:
+                resultado.erros.append((numero, f'produto {dados["produto_id"]} não encontrado'))
+                continue
+        else:
+            produto = por_nome.get(normalizar_texto(dados['nome']))
+            if produto is None:
+                if dados['preco_venda'] is None:
+                    resultado.erros.append((numero, f'produto novo "{dados["nome"]}" sem preco_venda'))
+                    continue
+                produto = Produto(nome=dados['nome'], tipo='Produto', preco_venda=dados['preco_venda'],
+                                  custo=dados['custo_unitario'], estoque=0)
+                inventario.adicionar_produto(produto)
+                por_nome[produto.nome_busca] = produto
+                resultado.produtos_criados += 1
+
+        if dados['preco_venda'] is not None and dados['preco_venda'] != produto.preco_venda:
+            inventario.atualizar_produto(produto, dados['preco_venda'], produto.custo, produto.estoque)
+
+        entradas.append({
+            'data': momento,
+            'produto_id': produto.id,
+            'quantidade': dados['quantidade'],
+            'custo_unitario': dados['custo_unitario'],
+            'total_custo': dados['quantidade'] * dados['custo_unitario'],
+        })
+        quantidades[produto.id] = quantidades.get(produto.id, 0) + dados['quantidade']
+
+    if entradas:
+        db.session.flush()
+        db.session.execute(insert(Entrada), entradas)
+        inventario.movimentar_em_lote(quantidades)
+        resumo.somar(data_local(momento), {'reposicoes': sum(e['total_custo'] for e in entradas)})
+        resultado.importadas += len(entradas)
+
+
+def importar_entradas(arquivo):
+    """Importa as entradas do CSV `arquivo` (binário) e confirma a transação.
+
+    Retorna um `ResultadoImportacao` com os totais e os erros por linha.
+    """
+    resultado = ResultadoImportacao()
+    momento = datetime.now(timezone.utc)
+    leitor = _leitor(arquivo)
+    if not {'quantidade', 'custo_unitario'} <= set(leitor.fieldnames) or not \
+            {'nome', 'produto_id'} & set(leitor.fieldnames):
+        resultado.erros.append((1, 'cabeçalho deve ter nome ou produto_id, quantidade e custo_unitario'))
+        return resultado
+
+    lote = []
+    for linha in leitor:
+        numero = leitor.line_num + 1  # o cabeçalho foi lido à parte
+        if not any((valor or '').strip() for valor in linha.values() if isinstance(valor, str)):
+            continue
+        try:
+            lote.append((numero, _ler_linha(linha)))
+        except ValueError as e:
+            resultado.erros.append((numero, str(e)))
+        if len(lote) >= TAMANHO_LOTE:
+            _processar_lote(lote, momento, resultado)
+            lote = []
+    if lote:
+        _processar_lote(lote, momento, resultado)
+
+    db.session.commit()
+    resultado.erros.sort()
+    return resultado
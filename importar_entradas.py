@@ -0,0 +1,15 @@
+import sys
+from __init__ import create_app
+from importacao import importar_entradas
+
+if len(sys.argv) != 2:
+    sys.exit("Uso: python importar_entradas.py arquivo.csv")
+
+app = create_app()
+
+with app.app_context(), open(sys.argv[1], 'rb') as arquivo:
+    resultado = importar_entradas(arquivo)
+
+for linha, erro in resultado.erros:
+    print(f"Linha {linha}: {erro}")
+print(f"{resultado.importadas} entradas importadas ({resultado.produtos_criados} produtos novos, {len(resultado.erros)} linhas com erro).")
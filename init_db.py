@@ -1,9 +1,13 @@
 from __init__ import create_app
 from models import db
+from migrations import aplicar_migracoes
 
 app = create_app()
 
 with app.app_context():
     db.create_all()
+    migracoes = aplicar_migracoes()
 
+for nome in migracoes:
+    print(f"Migração aplicada: {nome}")
 print("Banco de dados inicializado com sucesso!")
@@ -0,0 +1,150 @@
+"""Movimentação de estoque e valor do inventário.
+
+O custo e o valor de venda totais do estoque ficam em `valor_estoque` (uma
+única linha) e são ajustados a cada mudança de estoque ou de preço, para que a
+tela de produtos não precise somar o catálogo inteiro. Com filtro de pesquisa
+os totais são calculados no próprio banco.
+
+As quantidades são alteradas no próprio banco (`estoque = estoque + delta`),
+nunca lidas, somadas em Python e gravadas de volta: vendas simultâneas em
+workers diferentes não perdem atualizações. Com `BLOQUEAR_ESTOQUE_NEGATIVO`
+ativo, uma baixa maior que o estoque disponível é recusada na mesma instrução.
+"""
+from flask import current_app
+from sqlalchemy import case, func, update
+from models import db, Produto, ValorEstoque
+
+
+class EstoqueInsuficiente(Exception):
+    def __init__(self, nome, disponivel, solicitado):
+        super().__init__(f'Estoque insuficiente de {nome}: disponível {disponivel}, solicitado {solicitado}.')
+        self.disponivel = disponivel
+        self.solicitado = solicitado
+
+
+def _somar_produtos(*filtros):
+    custo, valor = db.session.query(
+        func.coalesce(func.sum(Produto.custo * Produto.estoque), 0.0),
+        func.coalesce(func.sum(Produto.preco_venda * Produto.estoque), 0.0),
+    ).filter(*filtros).one()
+    return custo, valor
+
+
+def recalcular_valor_estoque():
+    """Recalcula os totais em cache a partir da tabela de produtos."""
+    custo, valor = _somar_produtos()
+    db.session.query(ValorEstoque).delete()
+    db.session.add(ValorEstoque(id=1, custo_total=custo, valor_total=valor))
+    db.session.flush()
+    return custo, valor
+
+
+def _ajustar_valor(delta_custo, delta_valor):
+    if not delta_custo and not delta_valor:
+        return
+    alterado = db.session.execute(
+        update(ValorEstoque).where(ValorEstoque.id == 1).values(
+            custo_total=ValorEstoque.custo_total + delta_custo,
+            valor_total=ValorEstoque.valor_total + delta_valor,
+        )
+    ).rowcount
+    if not alterado:
+        # O cache ainda não existe: a soma já inclui a mudança pendente na sessão
+        recalcular_valor_estoque()
+
+
+def valor_estoque(*filtros):
+    """Retorna (custo total, valor de venda total) do estoque.
+
+    Sem filtros usa o cache; com filtros agrega no banco sem carregar os produtos.
+    """
+    if filtros:
+        return _somar_produtos(*filtros)
+    linha = db.session.query(ValorEstoque.custo_total, ValorEstoque.valor_total).filter(ValorEstoque.id == 1).first()
+    return tuple(linha) if linha else _somar_produtos()
+
+
+def adicionar_produto(produto):
+    db.session.add(produto)
+    db.session.flush()
+    _ajustar_valor(produto.custo * produto.estoque, produto.preco_venda * produto.estoque)
+
+
+def atualizar_produto(produto, preco_venda, custo, estoque):
+    """Altera preços e estoque de um produto ajustando o valor do inventário."""
+    custo_antigo = produto.custo * produto.estoque
+    valor_antigo = produto.preco_venda * produto.estoque
+    produto.preco_venda = preco_venda
+    produto.custo = custo
+    produto.estoque = estoque
+    _ajustar_valor(custo * estoque - custo_antigo, preco_venda * estoque - valor_antigo)
+
+
+def remover_produto(produto):
+    _ajustar_valor(-produto.custo * produto.estoque, -produto.preco_venda * produto.estoque)
+    db.session.delete(produto)
+
+
+def movimentar(produto_id, quantidade):
+    """Soma `quantidade` (negativa para baixas) ao estoque do produto.
+
+    Um único UPDATE ... RETURNING altera o estoque e devolve a linha
+    atualizada (estoque, custo, preco_venda, nome), dispensando o SELECT
+    prévio. Levanta `EstoqueInsuficiente` se a baixa deixaria o estoque
+    negativo e o bloqueio estiver ativo.
+    """
+    consulta = (
+        update(Produto).where(Produto.id == produto_id)
+        .values(estoque=Produto.estoque + quantidade)
+        .returning(Produto.estoque, Produto.custo, Produto.preco_venda, Produto.nome)
+    )
+    bloquear = quantidade < 0 and current_app.config.get('BLOQUEAR_ESTOQUE_NEGATIVO')
+    if bloquear:
+        consulta = consulta.where(Produto.estoque + quantidade >= 0)
+    linha = db.session.execute(consulta, execution_options={'synchronize_session': 'fetch'}).first()
+
+    if linha is None:
+        atual = db.session.query(Produto.nome, Produto.estoque).filter(Produto.id == produto_id).first()
+        if atual is None or not bloquear:
+            raise LookupError(f'Produto {produto_id} não encontrado.')
+        raise EstoqueInsuficiente(atual.nome, atual.estoque, -quantidade)
+
+    _ajustar_valor(linha.custo * quantidade, linha.preco_venda * quantidade)
+    return linha
+
+
+def movimentar_em_lote(quantidades):
+    """Soma ao estoque as quantidades {produto_id: quantidade} com um único UPDATE.
+
+    Devolve {produto_id: linha atualizada}, como `movimentar`, e aplica o
+    mesmo bloqueio de estoque negativo às baixas: se algum produto não tiver
+    estoque suficiente, nada é confirmado (a transação deve ser desfeita).
+    """
+    if not quantidades:
+        return {}
+    delta = case(quantidades, value=Produto.id, else_=0)
+    consulta = (
+        update(Produto).where(Produto.id.in_(quantidades))
+        .values(estoque=Produto.estoque + delta)
+        .returning(Produto.id, Produto.estoque, Produto.custo, Produto.preco_venda, Produto.nome)
+    )
+    bloquear = min(quantidades.values()) < 0 and current_app.config.get('BLOQUEAR_ESTOQUE_NEGATIVO')
+    if bloquear:
+        consulta = consulta.where(Produto.estoque + delta >= 0)
+    linhas = {linha.id: linha for linha in
+              db.session.execute(consulta, execution_options={'synchronize_session': 'fetch'})}
+
+    faltando = set(quantidades) - set(linhas)
+    if faltando:
+        atuais = db.session.query(Produto.id, Produto.nome, Produto.estoque).filter(Produto.id.in_(faltando)).all()
+        inexistentes = faltando - {atual.id for atual in atuais}
+        if inexistentes:
+            raise LookupError(f'Produto {min(inexistentes)} não encontrado.')
+        atual = min(atuais)
+        raise EstoqueInsuficiente(atual.nome, atual.estoque, -quantidades[atual.id])
+
+    _ajustar_valor(
+        sum(linha.custo * quantidades[produto_id] for produto_id, linha in linhas.items()),
+        sum(linha.preco_venda * quantidades[produto_id] for produto_id, linha in linhas.items()),
+    )
+    return linhas
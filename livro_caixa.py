@@ -0,0 +1,91 @@
+"""Lançamentos do caixa com saldo corrente.
+
+Cada transação guarda o saldo do caixa logo após ela (em ordem de id) e a
+tabela `saldo_caixa` guarda o saldo atual em uma única linha. Assim o saldo
+atual e o saldo em qualquer momento passado são consultas O(1), sem somar a
+tabela inteira. Toda inclusão, alteração ou exclusão no caixa deve passar por
+aqui para manter os saldos (e o resumo diário) consistentes.
+"""
+from sqlalchemy import func, case, update
+from models import db, Caixa, SaldoCaixa
+import resumo
+
+
+def _sinal(tipo, valor):
+    return valor if tipo == 'Entrada' else -valor
+
+
+def _mover_saldo(delta):
+    """Soma `delta` ao saldo atual e devolve o novo saldo.
+
+    O UPDATE trava a linha do saldo até o commit, então lançamentos
+    concorrentes recebem ids e saldos na mesma ordem.
+    """
+    novo_saldo = db.session.execute(
+        update(SaldoCaixa).where(SaldoCaixa.id == 1)
+        .values(saldo=SaldoCaixa.saldo + delta)
+        .returning(SaldoCaixa.saldo)
+    ).scalar()
+    if novo_saldo is None:
+        # Primeiro lançamento: consolida o que já existir na tabela
+        novo_saldo = _somar_caixa() + delta
+        db.session.add(SaldoCaixa(id=1, saldo=novo_saldo))
+        db.session.flush()
+    return novo_saldo
+
+
+def _somar_caixa():
+    return db.session.query(
+        func.sum(case((Caixa.tipo == 'Entrada', Caixa.valor), else_=-Caixa.valor))
+    ).scalar() or 0.0
+
+
+def _ajustar_posteriores(transacao, delta):
+    db.session.query(Caixa).filter(Caixa.id > transacao.id).update(
+        {Caixa.saldo: Caixa.saldo + delta}, synchronize_session=False
+    )
+
+
+def lancar(tipo, valor, descricao, origem_id=None, origem_tipo=None):
+    """Cria uma transação de caixa já com o saldo corrente."""
+    saldo = _mover_saldo(_sinal(tipo, valor))
+    transacao = Caixa(tipo=tipo, valor=valor, descricao=descricao, saldo=saldo,
+                      origem_id=origem_id, origem_tipo=origem_tipo)
+    db.session.add(transacao)
+    db.session.flush()
+    resumo.registrar(transacao)
+    return transacao
+
+
+def alterar_valor(transacao, valor):
+    """Altera o valor de uma transação e corrige os saldos a partir dela."""
+    delta = _sinal(transacao.tipo, valor) - _sinal(transacao.tipo, transacao.valor)
+    resumo.registrar(transacao, -1)
+    transacao.valor = valor
+    resumo.registrar(transacao)
+    if delta:
+        _mover_saldo(delta)
+        transacao.saldo += delta
+        _ajustar_posteriores(transacao, delta)
+
+
+def remover(transacao):
+    """Exclui uma transação e corrige os saldos das posteriores."""
+    delta = -_sinal(transacao.tipo, transacao.valor)
+    _mover_saldo(delta)
+    _ajustar_posteriores(transacao, delta)
+    resumo.registrar(transacao, -1)
+    db.session.delete(transacao)
+
+
+def saldo_atual():
+    saldo = db.session.query(SaldoCaixa.saldo).filter(SaldoCaixa.id == 1).scalar()
+    return saldo if saldo is not None else _somar_caixa()
+
+
+def saldo_em(momento):
+    """Saldo do caixa no instante `momento` (UTC), pela última transação até ele."""
+    saldo = db.session.query(Caixa.saldo).filter(Caixa.data <= momento).order_by(
+        Caixa.data.desc(), Caixa.id.desc()
+    ).limit(1).scalar()
+    return saldo or 0.0
@@ -0,0 +1,196 @@
+"""Instrumentação de desempenho por requisição e rota /metrics.
+
+Para cada requisição são medidos o número de comandos SQL, o tempo gasto no
+banco (eventos `before/after_cursor_execute` do SQLAlchemy), o tempo de
+renderização dos templates (sinais do Jinja no Flask) e o tempo total. Os
+valores vão para:
+
+- o cabeçalho `Server-Timing`, visível nas ferramentas do navegador;
+- histogramas por endpoint (`main.relatorios`, `main.produtos`...) no formato
+  do Prometheus, servidos em `/metrics` junto com o estado do pool de conexões;
+- o log, para comandos mais lentos que `SLOW_QUERY_MS` (padrão 200 ms).
+
+Os números ficam na memória de cada worker; cada série leva o pid do worker
+no rótulo `worker`, para que o Prometheus some os workers. `/metrics` exige
+login ou o cabeçalho `Authorization: Bearer <METRICS_TOKEN>`.
+"""
+import logging
+import os
+import threading
+import time
+from flask import Response, abort, current_app, g, has_request_context, request, request_finished, \
+    request_started, before_render_template, template_rendered
+from flask_login import current_user
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from models import db
+
+PREFIXO = 'smart_finance'
+LIMITES_TEMPO = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+LIMITES_CONSULTAS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+log = logging.getLogger(__name__)
+
+
+class Histograma:
+    def __init__(self, nome, ajuda, limites):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.limites = limites
+        self.series = {}  # endpoint -> [contagem por limite..., soma, total]
+        self._trava = threading.Lock()
+
+    def observar(self, endpoint, valor):
+        with self._trava:
+            serie = self.series.setdefault(endpoint, [0] * len(self.limites) + [0.0, 0])
+            for i, limite in enumerate(self.limites):
+                if valor <= limite:
+                    serie[i] += 1
+            serie[-2] += valor
+            serie[-1] += 1
+
+    def exportar(self, worker):
+        linhas = [f'# HELP {self.nome} {self.ajuda}', f'# TYPE {self.nome} histogram']
+        with self._trava:
+            series = {endpoint: list(serie) for endpoint, serie in self.series.items()}
+        for endpoint, serie in sorted(series.items()):
+            rotulos = f'endpoint="{endpoint}",worker="{worker}"'
+            for limite, contagem in zip(self.limites, serie):
+                linhas.append(f'{self.nome}_bucket{{{rotulos},le="{limite}"}} {contagem}')
+            linhas.append(f'{self.nome}_bucket{{{rotulos},le="+Inf"}} {serie[-1]}')
+            linhas.append(f'{self.nome}_sum{{{rotulos}}} {serie[-2]:.6f}')
+            linhas.append(f'{self.nome}_count{{{rotulos}}} {serie[-1]}')
+        return linhas
+
+
+class Contador:
+    def __init__(self, nome, ajuda):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.valores = {}
+        self._trava = threading.Lock()
+
+    def somar(self, endpoint, valor=1):
+        with self._trava:
+            self.valores[endpoint] = self.valores.get(endpoint, 0) + valor
+
+    def exportar(self, worker):
+        linhas = [f'# HELP {self.nome} {self.ajuda}', f'# TYPE {self.nome} counter']
+        with self._trava:
+            valores = dict(self.valores)
+        for endpoint, valor in sorted(valores.items()):
+            linhas.append(f'{self.nome}{{endpoint="{endpoint}",worker="{worker}"}} {valor}')
+        return linhas
+
+
+duracao_requisicao = Histograma(f'{PREFIXO}_request_duration_seconds', 'Tempo total da requisição.', LIMITES_TEMPO)
+duracao_banco = Histograma(f'{PREFIXO}_db_duration_seconds', 'Tempo gasto em comandos SQL por requisição.', LIMITES_TEMPO)
+duracao_templates = Histograma(f'{PREFIXO}_template_duration_seconds', 'Tempo de renderização dos templates por requisição.', LIMITES_TEMPO)
+consultas_requisicao = Histograma(f'{PREFIXO}_db_queries_per_request', 'Comandos SQL por requisição.', LIMITES_CONSULTAS)
+consultas_lentas = Contador(f'{PREFIXO}_slow_queries_total', 'Comandos SQL acima de SLOW_QUERY_MS.')
+
+METRICAS = [duracao_requisicao, duracao_banco, duracao_templates, consultas_requisicao, consultas_lentas]
+
+
+def _endpoint():
+    return request.endpoint or 'nao_encontrado'
+
+
+def _antes_comando(conexao, cursor, comando, parametros, contexto, varios):
+    if contexto is not None:
+        contexto.inicio_metricas = time.perf_counter()
+
+
+def _depois_comando(conexao, cursor, comando, parametros, contexto, varios):
+    inicio = getattr(contexto, 'inicio_metricas', None)
+    if inicio is None:
+        return
+    duracao = time.perf_counter() - inicio
+    endpoint = None
+    if has_request_context() and 'metricas' in g:
+        g.metricas['consultas'] += 1
+        g.metricas['banco'] += duracao
+        endpoint = _endpoint()
+        limite = current_app.config['SLOW_QUERY_MS']
+    else:
+        limite = int(os.getenv('SLOW_QUERY_MS') or 200)
+    if duracao * 1000 >= limite:
+        consultas_lentas.somar(endpoint or 'fora_de_requisicao')
+        log.warning('Consulta lenta (%.0f ms) em %s: %s', duracao * 1000, endpoint or '-', comando[:500])
+
+
+def _inicio_requisicao(sender, **extra):
+    g.metricas = {'inicio': time.perf_counter(), 'consultas': 0, 'banco': 0.0, 'templates': 0.0, 'renderizando': []}
+
+
+def _antes_template(sender, template, context, **extra):
+    if 'metricas' in g:
+        g.metricas['renderizando'].append(time.perf_counter())
+
+
+def _depois_template(sender, template, context, **extra):
+    if 'metricas' in g and g.metricas['renderizando']:
+        inicio = g.metricas['renderizando'].pop()
+        # Um render_template chamado durante outra renderização já conta no tempo da externa
+        if not g.metricas['renderizando']:
+            g.metricas['templates'] += time.perf_counter() - inicio
+
+
+def _fim_requisicao(sender, response, **extra):
+    metricas = g.pop('metricas', None)
+    if metricas is None:
+        return
+    total = time.perf_counter() - metricas['inicio']
+    endpoint = _endpoint()
+    duracao_requisicao.observar(endpoint, total)
+    duracao_banco.observar(endpoint, metricas['banco'])
+    duracao_templates.observar(endpoint, metricas['templates'])
+    consultas_requisicao.observar(endpoint, metricas['consultas'])
+    response.headers.add(
+        'Server-Timing',
+        f'db;dur={metricas["banco"] * 1000:.1f};desc="{metricas["consultas"]} consultas", '
+        f'tpl;dur={metricas["templates"] * 1000:.1f}, total;dur={total * 1000:.1f}',
+    )
+
+
+def _estado_pool(worker):
+    pool = db.engine.pool
+    if not hasattr(pool, 'checkedout'):
+        return []  # NullPool (PgBouncer) ou pool do SQLite sem contadores
+    valores = {
+        'size': (pool.size(), 'Conexões mantidas pelo pool.'),
+        'checked_out': (pool.checkedout(), 'Conexões em uso.'),
+        'checked_in': (pool.checkedin(), 'Conexões livres no pool.'),
+        'overflow': (pool.overflow(), 'Conexões além do tamanho do pool.'),
+    }
+    linhas = []
+    for nome, (valor, ajuda) in valores.items():
+        linhas += [f'# HELP {PREFIXO}_db_pool_{nome} {ajuda}', f'# TYPE {PREFIXO}_db_pool_{nome} gauge',
+                   f'{PREFIXO}_db_pool_{nome}{{worker="{worker}"}} {valor}']
+    return linhas
+
+
+def metrics():
+    token = os.getenv('METRICS_TOKEN')
+    autorizado = token and request.headers.get('Authorization') == f'Bearer {token}'
+    if not autorizado and not current_user.is_authenticated:
+        abort(401)
+    worker = os.getpid()
+    linhas = []
+    for metrica in METRICAS:
+        linhas += metrica.exportar(worker)
+    linhas += _estado_pool(worker)
+    return Response('\n'.join(linhas) + '\n', mimetype='text/plain; version=0.0.4')
+
+
+def registrar(app):
+    """Liga a instrumentação ao app e cria a rota /metrics."""
+    app.config.setdefault('SLOW_QUERY_MS', int(os.getenv('SLOW_QUERY_MS') or 200))
+    if not event.contains(Engine, 'before_cursor_execute', _antes_comando):
+        event.listen(Engine, 'before_cursor_execute', _antes_comando)
+        event.listen(Engine, 'after_cursor_execute', _depois_comando)
+    request_started.connect(_inicio_requisicao, app)
+    request_finished.connect(_fim_requisicao, app)
+    before_render_template.connect(_antes_template, app)
+    template_rendered.connect(_depois_template, app)
+    app.add_url_rule('/metrics', 'metrics', metrics)
@@ -0,0 +1,190 @@
+"""Migrações de esquema e dados para bancos criados por versões anteriores.
+
+`db.create_all()` só cria tabelas novas; colunas e índices adicionados a
+tabelas existentes (e o preenchimento dos dados antigos) ficam aqui. Cada
+migração roda uma única vez e é registrada na tabela `migracoes`. Em um banco
+novo elas apenas detectam que as colunas já existem.
+"""
+from sqlalchemy import func, inspect, text, update
+from models import db, Produto, Saida, Servico, Caixa, SaldoCaixa, Migracao
+from resumo import reconstruir_resumo
+from inventario import recalcular_valor_estoque
+from utils import normalizar_pagamento, normalizar_texto
+
+
+def _tem_coluna(tabela, coluna):
+    return coluna in {c['name'] for c in inspect(db.engine).get_columns(tabela)}
+
+
+def _adicionar_coluna(tabela, coluna, tipo):
+    if not _tem_coluna(tabela, coluna):
+        db.session.execute(text(f'ALTER TABLE {tabela} ADD COLUMN {coluna} {tipo}'))
+
+
+def _criar_indice(nome, tabela, colunas):
+    db.session.execute(text(f'CREATE INDEX IF NOT EXISTS {nome} ON {tabela} ({colunas})'))
+
+
+def _preencher_codigos(model):
+    formas = db.session.query(model.forma_pagamento).filter(
+        model.forma_pagamento.isnot(None), model.pagamento_codigo.is_(None)
+    ).distinct().all()
+    for (forma,) in formas:
+        db.session.query(model).filter(model.forma_pagamento == forma).update(
+            {model.pagamento_codigo: normalizar_pagamento(forma)}, synchronize_session=False
+        )
+
+
+def codigo_pagamento():
+    """Código normalizado e indexado da forma de pagamento em vendas e serviços."""
+    for model in (Saida, Servico):
+        tabela = model.__tablename__
+        _adicionar_coluna(tabela, 'pagamento_codigo', 'VARCHAR(20)')
+        _criar_indice(f'ix_{tabela}_pagamento_codigo', tabela, 'pagamento_codigo')
+        _preencher_codigos(model)
+    db.session.commit()
+
+
+def custo_unitario_saidas():
+    """Custo do produto gravado na venda, para que o lucro histórico não mude ao editar o produto."""
+    _adicionar_coluna('saidas', 'custo_unitario', 'FLOAT')
+    # Vendas antigas não guardaram o custo da época: usa o custo atual do produto.
+    custo_atual = db.session.query(Produto.custo).filter(Produto.id == Saida.produto_id).scalar_subquery()
+    db.session.query(Saida).filter(Saida.custo_unitario.is_(None)).update(
+        {Saida.custo_unitario: custo_atual}, synchronize_session=False
+    )
+    db.session.commit()
+
+
+def saldo_corrente_caixa():
+    """Saldo corrente em cada transação do caixa e saldo atual consolidado."""
+    _adicionar_coluna('caixa', 'saldo', 'FLOAT')
+    _criar_indice('ix_caixa_data', 'caixa', 'data')
+    db.session.execute(text(
+        "UPDATE caixa SET saldo = corrente.saldo FROM ("
+        " SELECT id, SUM(CASE WHEN tipo = 'Entrada' THEN valor ELSE -valor END) OVER (ORDER BY id) AS saldo"
+        " FROM caixa) AS corrente"
+        " WHERE caixa.id = corrente.id"
+    ))
+    ultimo = db.session.query(Caixa.saldo).order_by(Caixa.id.desc()).limit(1).scalar() or 0.0
+    db.session.query(SaldoCaixa).delete()
+    db.session.add(SaldoCaixa(id=1, saldo=ultimo))
+    db.session.commit()
+
+
+def valor_estoque():
+    """Totais do inventário em cache para a tela de produtos."""
+    recalcular_valor_estoque()
+    db.session.commit()
+
+
+def indices_paginacao():
+    """Índices compostos usados pela paginação por cursor (paginacao.py)."""
+    _criar_indice('ix_produtos_nome_id', 'produtos', 'nome, id')
+    _criar_indice('ix_entradas_data_id', 'entradas', 'data, id')
+    _criar_indice('ix_saidas_data_id', 'saidas', 'data, id')
+    _criar_indice('ix_servicos_data_hora_id', 'servicos', 'data_hora, id')
+    _criar_indice('ix_caixa_data_id', 'caixa', 'data, id')
+    # Substituído pelo índice composto acima
+    db.session.execute(text('DROP INDEX IF EXISTS ix_caixa_data'))
+    db.session.commit()
+
+
+def indice_servicos_finalizados():
+    """Índice para os filtros de serviços finalizados por período."""
+    _criar_indice('ix_servicos_status_data_hora', 'servicos', 'status, data_hora')
+    db.session.commit()
+
+
+def busca_produtos():
+    """Nome normalizado dos produtos e índice de trigramas para a pesquisa (ver busca.py)."""
+    _adicionar_coluna('produtos', 'nome_busca', 'VARCHAR(100)')
+    produtos = db.session.query(Produto.id, Produto.nome).filter(Produto.nome_busca.is_(None)).all()
+    if produtos:
+        db.session.execute(
+            update(Produto),
+            [{'id': id, 'nome_busca': normalizar_texto(nome)} for id, nome in produtos],
+        )
+
+    dialeto = db.engine.dialect.name
+    if dialeto == 'postgresql':
+        db.session.execute(text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+        db.session.execute(text(
+            'CREATE INDEX IF NOT EXISTS ix_produtos_nome_busca_trgm ON produtos USING gin (nome_busca gin_trgm_ops)'
+        ))
+    elif dialeto == 'sqlite':
+        db.session.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS produtos_fts USING fts5("
+            "nome_busca, content='produtos', content_rowid='id', tokenize='trigram')"
+        ))
+        db.session.execute(text(
+            "CREATE TRIGGER IF NOT EXISTS produtos_fts_ai AFTER INSERT ON produtos BEGIN"
+            " INSERT INTO produtos_fts(rowid, nome_busca) VALUES (new.id, new.nome_busca); END"
+        ))
+        db.session.execute(text(
+            "CREATE TRIGGER IF NOT EXISTS produtos_fts_ad AFTER DELETE ON produtos BEGIN"
+            " INSERT INTO produtos_fts(produtos_fts, rowid, nome_busca) VALUES ('delete', old.id, old.nome_busca); END"
+        ))
+        db.session.execute(text(
+            "CREATE TRIGGER IF NOT EXISTS produtos_fts_au AFTER UPDATE OF nome_busca ON produtos BEGIN"
+            " INSERT INTO produtos_fts(produtos_fts, rowid, nome_busca) VALUES ('delete', old.id, old.nome_busca);"
+            " INSERT INTO produtos_fts(rowid, nome_busca) VALUES (new.id, new.nome_busca); END"
+        ))
+        db.session.execute(text("INSERT INTO produtos_fts(produtos_fts) VALUES ('rebuild')"))
+    db.session.commit()
+
+
+def vendas_com_varios_itens():
+    """Venda à qual cada saída pertence (a tabela `vendas` é criada pelo create_all)."""
+    _adicionar_coluna('saidas', 'venda_id', 'INTEGER REFERENCES vendas (id)')
+    _criar_indice('ix_saidas_venda_id', 'saidas', 'venda_id')
+    db.session.commit()
+
+
+def subtipo_servicos():
+    """Subtipo do serviço em coluna própria, no lugar do prefixo `[REVENDA]` na descrição."""
+    _adicionar_coluna('servicos', 'subtipo', 'VARCHAR(20)')
+    _criar_indice('ix_servicos_subtipo', 'servicos', 'subtipo')
+    prefixo = '[REVENDA]'
+    db.session.query(Servico).filter(Servico.servico_descricao.like(f'{prefixo}%')).update(
+        {Servico.subtipo: 'Revenda',
+         Servico.servico_descricao: func.trim(func.substr(Servico.servico_descricao, len(prefixo) + 1))},
+        synchronize_session=False,
+    )
+    for tipo, subtipo in (('Manutenção', 'Manutenção'), ('Venda de Aparelho', 'Reforma')):
+        db.session.query(Servico).filter(Servico.subtipo.is_(None), Servico.tipo == tipo).update(
+            {Servico.subtipo: subtipo}, synchronize_session=False
+        )
+    db.session.commit()
+
+
+MIGRACOES = [
+    codigo_pagamento,
+    custo_unitario_saidas,
+    saldo_corrente_caixa,
+    valor_estoque,
+    indices_paginacao,
+    indice_servicos_finalizados,
+    busca_produtos,
+    vendas_com_varios_itens,
+    subtipo_servicos,
+]
+
+
+def aplicar_migracoes():
+    """Aplica, em ordem, as migrações ainda não registradas. Retorna os nomes aplicados.
+
+    O resumo diário é reconstruído ao final, já com todas as colunas migradas.
+    """
+    aplicadas = {m.nome for m in Migracao.query.all()}
+    novas = []
+    for migracao in MIGRACOES:
+        if migracao.__name__ in aplicadas:
+            continue
+        migracao()
+        db.session.add(Migracao(nome=migracao.__name__))
+        db.session.commit()
+        novas.append(migracao.__name__)
+    if novas:
+        reconstruir_resumo()
+    return novas
@@ -1,21 +1,34 @@
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Text, Float, Date, DateTime, ForeignKey, Index
+from sqlalchemy.orm import relationship, validates
 from datetime import datetime, timezone
+from utils import normalizar_pagamento, normalizar_texto
 
 db = SQLAlchemy()
 
 class Produto(db.Model):
     __tablename__ = 'produtos'
+    __table_args__ = (Index('ix_produtos_nome_id', 'nome', 'id'),)
     id = Column(Integer, primary_key=True)
     nome = Column(String(100), nullable=False)
+    nome_busca = Column(String(100))  # nome sem acentos e em minúsculas (ver busca.py)
     tipo = Column(String(50), nullable=False)
     preco_venda = Column(Float, nullable=False)
     custo = Column(Float, nullable=False)
     estoque = Column(Integer, default=0)
 
+    @validates('nome')
+    def _normalizar_nome(self, key, nome):
+        self.nome_busca = normalizar_texto(nome)
+        return nome
+
+    def to_dict(self):
+        return {'id': self.id, 'nome': self.nome, 'tipo': self.tipo, 'preco_venda': self.preco_venda,
+                'custo': self.custo, 'estoque': self.estoque}
+
 class Entrada(db.Model):
     __tablename__ = 'entradas'
+    __table_args__ = (Index('ix_entradas_data_id', 'data', 'id'),)
     id = Column(Integer, primary_key=True)
     data = Column(DateTime, default=lambda: datetime.now(timezone.utc))
     produto_id = Column(Integer, ForeignKey('produtos.id'), nullable=False)
@@ -24,38 +37,167 @@ class Entrada(db.Model):
     custo_unitario = Column(Float, nullable=False)
     total_custo = Column(Float, nullable=False)
 
+    def to_dict(self):
+        return {'id': self.id, 'data': self.data.isoformat() if self.data else None,
+                'produto_id': self.produto_id, 'produto_nome': self.produto.nome,
+                'quantidade': self.quantidade, 'custo_unitario': self.custo_unitario,
+                'total_custo': self.total_custo}
+
+class Venda(db.Model):
+    """Agrupa as saídas registradas juntas em uma venda com vários itens (ver vendas.py)."""
+    __tablename__ = 'vendas'
+    id = Column(Integer, primary_key=True)
+    data = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
 class Saida(db.Model):
     __tablename__ = 'saidas'
+    __table_args__ = (Index('ix_saidas_data_id', 'data', 'id'),)
     id = Column(Integer, primary_key=True)
     data = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    venda_id = Column(Integer, ForeignKey('vendas.id'), index=True)  # nulo em vendas de um único item
     produto_id = Column(Integer, ForeignKey('produtos.id'), nullable=False)
     produto = relationship('Produto')
     quantidade = Column(Integer, nullable=False)
     preco_unitario = Column(Float, nullable=False)
+    custo_unitario = Column(Float, nullable=False)  # custo do produto no momento da venda
     total_venda = Column(Float, nullable=False)
     forma_pagamento = Column(String(50))
+    pagamento_codigo = Column(String(20), index=True)
     cliente = Column(String(100))
 
+    @validates('forma_pagamento')
+    def _normalizar_pagamento(self, key, forma_pagamento):
+        self.pagamento_codigo = normalizar_pagamento(forma_pagamento)
+        return forma_pagamento
+
+    def to_dict(self):
+        return {'id': self.id, 'data': self.data.isoformat() if self.data else None,
+                'produto_id': self.produto_id, 'produto_nome': self.produto.nome,
+                'quantidade': self.quantidade, 'preco_unitario': self.preco_unitario,
+                'total_venda': self.total_venda, 'forma_pagamento': self.forma_pagamento,
+                'pagamento_codigo': self.pagamento_codigo, 'cliente': self.cliente,
+                'venda_id': self.venda_id}
+
 class Servico(db.Model):
     __tablename__ = 'servicos'
+    __table_args__ = (
+        Index('ix_servicos_data_hora_id', 'data_hora', 'id'),
+        Index('ix_servicos_status_data_hora', 'status', 'data_hora'),
+    )
     id = Column(Integer, primary_key=True)
     data_hora = Column(DateTime, default=lambda: datetime.now(timezone.utc))
     servico_descricao = Column(String(255), nullable=False)
     aparelho = Column(String(100))
     tipo = Column(String(50), nullable=False)
+    subtipo = Column(String(20), index=True)  # Manutenção, Reforma ou Revenda (ver utils.subtipo_servico)
     custo_pecas = Column(Float, default=0.0)
     mao_de_obra = Column(Float, default=0.0)
     preco_aparelho = Column(Float, default=0.0)
     status = Column(String(50), default='Iniciado')
     forma_pagamento = Column(String(100))
+    pagamento_codigo = Column(String(20), index=True)
     cliente = Column(String(100))
 
+    @validates('forma_pagamento')
+    def _normalizar_pagamento(self, key, forma_pagamento):
+        self.pagamento_codigo = normalizar_pagamento(forma_pagamento)
+        return forma_pagamento
+
+    def to_dict(self):
+        return {'id': self.id, 'data_hora': self.data_hora.isoformat() if self.data_hora else None,
+                'servico_descricao': self.servico_descricao, 'aparelho': self.aparelho, 'tipo': self.tipo,
+                'subtipo': self.subtipo,
+                'custo_pecas': self.custo_pecas, 'mao_de_obra': self.mao_de_obra,
+                'preco_aparelho': self.preco_aparelho, 'status': self.status,
+                'forma_pagamento': self.forma_pagamento, 'pagamento_codigo': self.pagamento_codigo,
+                'cliente': self.cliente}
+
 class Caixa(db.Model):
     __tablename__ = 'caixa'
+    __table_args__ = (Index('ix_caixa_data_id', 'data', 'id'),)
     id = Column(Integer, primary_key=True)
     data = Column(DateTime, default=lambda: datetime.now(timezone.utc))
     tipo = Column(String(10), nullable=False)  # 'Entrada' ou 'Retirada'
     valor = Column(Float, nullable=False)
     descricao = Column(String(255), nullable=False)
+    saldo = Column(Float)  # saldo do caixa após esta transação (ver livro_caixa.py)
     origem_id = Column(Integer, nullable=True)
-    origem_tipo = Column(String(50), nullable=True) # 'saida' ou 'servico'
\ No newline at end of file
+    origem_tipo = Column(String(50), nullable=True) # 'saida', 'venda' ou 'servico'
+
+    def to_dict(self):
+        return {'id': self.id, 'data': self.data.isoformat() if self.data else None,
+                'tipo': self.tipo, 'valor': self.valor, 'descricao': self.descricao, 'saldo': self.saldo,
+                'origem_id': self.origem_id, 'origem_tipo': self.origem_tipo}
+
+class SaldoCaixa(db.Model):
+    """Saldo atual do caixa, em uma única linha (id=1)."""
+    __tablename__ = 'saldo_caixa'
+    id = Column(Integer, primary_key=True)
+    saldo = Column(Float, nullable=False, default=0.0)
+
+class ValorEstoque(db.Model):
+    """Custo e valor de venda totais do estoque, em uma única linha (id=1)."""
+    __tablename__ = 'valor_estoque'
+    id = Column(Integer, primary_key=True)
+    custo_total = Column(Float, nullable=False, default=0.0)
+    valor_total = Column(Float, nullable=False, default=0.0)
+
+class ResumoDiario(db.Model):
+    """Totais pré-calculados por dia (data local da loja) usados pelos relatórios."""
+    __tablename__ = 'resumo_diario'
+    dia = Column(Date, primary_key=True)
+    receita_produtos = Column(Float, nullable=False, default=0.0)
+    custo_produtos = Column(Float, nullable=False, default=0.0)
+    reposicoes = Column(Float, nullable=False, default=0.0)
+    receita_manutencao = Column(Float, nullable=False, default=0.0)
+    custo_manutencao = Column(Float, nullable=False, default=0.0)
+    receita_reformas = Column(Float, nullable=False, default=0.0)
+    custo_reformas = Column(Float, nullable=False, default=0.0)
+    receita_revendas = Column(Float, nullable=False, default=0.0)
+    custo_revendas = Column(Float, nullable=False, default=0.0)
+    caixa_entradas = Column(Float, nullable=False, default=0.0)
+    caixa_retiradas = Column(Float, nullable=False, default=0.0)
+
+class ResumoPagamento(db.Model):
+    """Total recebido por forma de pagamento em cada dia."""
+    __tablename__ = 'resumo_pagamentos'
+    dia = Column(Date, primary_key=True)
+    forma = Column(String(20), primary_key=True)  # código de utils.FORMAS_PAGAMENTO
+    valor = Column(Float, nullable=False, default=0.0)
+
+class Migracao(db.Model):
+    """Migrações de esquema já aplicadas (ver migrations.py)."""
+    __tablename__ = 'migracoes'
+    nome = Column(String(100), primary_key=True)
+    aplicada_em = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+class VersaoTabela(db.Model):
+    """Contador de alterações de cada tabela, usado nos ETags (ver versoes.py)."""
+    __tablename__ = 'versoes_tabelas'
+    tabela = Column(String(50), primary_key=True)
+    versao = Column(Integer, nullable=False, default=0)
+
+class Tarefa(db.Model):
+    """Operação demorada executada pelo worker.py (ver tarefas.py)."""
+    __tablename__ = 'tarefas'
+    __table_args__ = (Index('ix_tarefas_status_id', 'status', 'id'),)
+    id = Column(Integer, primary_key=True)
+    tipo = Column(String(30), nullable=False)  # chave de tarefas.EXECUTORES
+    parametros = Column(Text)  # JSON
+    status = Column(String(20), nullable=False, default='pendente')  # pendente, executando, concluida, erro
+    etapa = Column(String(100))
+    progresso = Column(Integer, nullable=False, default=0)
+    mensagem = Column(Text)
+    arquivo = Column(String(500))  # resultado para download
+    nome_arquivo = Column(String(255))
+    criada_em = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    iniciada_em = Column(DateTime)
+    atualizada_em = Column(DateTime)
+    concluida_em = Column(DateTime)
+
+    def to_dict(self):
+        return {'id': self.id, 'tipo': self.tipo, 'status': self.status, 'etapa': self.etapa,
+                'progresso': self.progresso, 'mensagem': self.mensagem,
+                'nome_arquivo': self.nome_arquivo if self.arquivo else None,
+                'criada_em': self.criada_em.isoformat() if self.criada_em else None,
+                'concluida_em': self.concluida_em.isoformat() if self.concluida_em else None}
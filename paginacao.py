@@ -0,0 +1,58 @@
+"""Paginação por cursor (keyset) para as listagens.
+
+Em vez de OFFSET + COUNT(*), cada página busca as linhas seguintes à última
+chave exibida, por exemplo (data, id), usando o índice composto da tabela.
+Busca-se uma linha a mais que o tamanho da página só para saber se há
+próxima página. O cursor é opaco para o navegador.
+"""
+import base64
+import json
+from datetime import datetime
+from flask import abort
+from sqlalchemy import DateTime, literal, tuple_
+
+
+class Pagina:
+    def __init__(self, items, has_next, next_cursor):
+        self.items = items
+        self.has_next = has_next
+        self.next_cursor = next_cursor
+
+
+def _codificar(valores):
+    texto = json.dumps([v.isoformat() if isinstance(v, datetime) else v for v in valores])
+    return base64.urlsafe_b64encode(texto.encode()).decode().rstrip('=')
+
+
+def _decodificar(cursor, colunas):
+    try:
+        texto = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        valores = json.loads(texto)
+        if len(valores) != len(colunas):
+            raise ValueError(cursor)
+        return [
+            datetime.fromisoformat(v) if isinstance(c.type, DateTime) else v
+            for v, c in zip(valores, colunas)
+        ]
+    except (ValueError, TypeError):
+        abort(400, 'Cursor de paginação inválido.')
+
+
+def paginar(query, colunas, cursor=None, por_pagina=20, desc=False):
+    """Retorna a página de `query` ordenada por `colunas` após o `cursor`.
+
+    A última coluna deve ser única (normalmente o id) para desempatar.
+    """
+    chave = tuple_(*colunas)
+    if cursor:
+        valores = _decodificar(cursor, colunas)
+        limite = tuple_(*[literal(v, c.type) for v, c in zip(valores, colunas)])
+        query = query.filter(chave < limite if desc else chave > limite)
+
+    ordem = [c.desc() for c in colunas] if desc else list(colunas)
+    linhas = query.order_by(*ordem).limit(por_pagina + 1).all()
+
+    has_next = len(linhas) > por_pagina
+    items = linhas[:por_pagina]
+    next_cursor = _codificar([getattr(items[-1], c.key) for c in colunas]) if has_next else None
+    return Pagina(items, has_next, next_cursor)
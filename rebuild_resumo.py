@@ -0,0 +1,9 @@
+from __init__ import create_app
+from resumo import reconstruir_resumo
+
+app = create_app()
+
+with app.app_context():
+    dias = reconstruir_resumo()
+
+print(f"Resumo diário reconstruído com sucesso ({dias} dias).")
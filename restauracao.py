@@ -0,0 +1,172 @@
+"""Restauração de backup em um banco de preparação, com troca por renomeação.
+
+1. Um banco `<nome>_restauracao` é criado e recebe o backup: `pg_restore -j N`
+   para arquivos .dump (formato custom) ou `psql` para .sql antigos.
+2. O esquema do banco restaurado é atualizado como no init_db.py
+   (`create_all` e migrações pendentes, que também recalculam o resumo, o saldo
+   do caixa e o valor do estoque), já que backups antigos não têm as colunas e
+   tabelas novas. Depois ele é validado: toda tabela e coluna dos modelos
+   precisa existir.
+3. O banco atual é renomeado para `<nome>_anterior` (mantido como cópia de
+   segurança até a próxima restauração) e o restaurado assume o nome original.
+
+A loja só fica fora do ar durante a troca de nomes. A restauração roda como
+tarefa do worker (ver tarefas.py), que recebe o andamento por `progresso`.
+"""
+import os
+import subprocess
+from flask import Flask
+from sqlalchemy import create_engine, inspect, text
+from models import db
+from migrations import aplicar_migracoes
+import cache_relatorios
+import versoes
+
+TABELAS_OBRIGATORIAS = {'produtos', 'entradas', 'saidas', 'servicos', 'caixa'}
+
+
+class ErroRestauracao(Exception):
+    pass
+
+
+def _q(nome):
+    return '"' + nome.replace('"', '""') + '"'
+
+
+def _ambiente_pg():
+    return {**os.environ, 'PGPASSWORD': os.getenv('DB_PASSWORD') or ''}
+
+
+def _conexao_pg():
+    return ['-h', os.getenv('DB_HOST'), '-p', os.getenv('DB_PORT'), '-U', os.getenv('DB_USER')]
+
+
+def _executar(comando, **kwargs):
+    processo = subprocess.run(comando, capture_output=True, env=_ambiente_pg(), **kwargs)
+    if processo.returncode != 0:
+        raise ErroRestauracao(processo.stderr.decode(errors='replace').strip() or f'{comando[0]} falhou')
+    return processo.stdout.decode(errors='replace')
+
+
+def _restaurar_dump(caminho, banco, progresso):
+    # Total de itens do backup, para calcular o percentual pelo log do pg_restore
+    total = sum(1 for linha in _executar(['pg_restore', '-l', caminho]).splitlines()
+                if linha.strip() and not linha.startswith(';')) or 1
+    tarefas = int(os.getenv('RESTORE_JOBS') or min(os.cpu_count() or 1, 4))
+    processo = subprocess.Popen(
+        ['pg_restore', *_conexao_pg(), '-d', banco, '-j', str(tarefas), '--no-owner', '-v', caminho],
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, env=_ambiente_pg(), text=True, errors='replace',
+    )
+    concluidos = 0
+    erros = []
+    for linha in processo.stderr:
+        if 'processing item' in linha or 'finished item' in linha:
+            concluidos += 1
+            progresso('restaurando', min(99, int(concluidos * 100 / total)))
+        elif 'error' in linha.lower():
+            erros.append(linha.strip())
+    if processo.wait() != 0:
+        raise ErroRestauracao('\n'.join(erros[-5:]) or 'pg_restore falhou')
+
+
+def _conferir_tabelas(inspetor, obrigatorias):
+    faltando = obrigatorias - set(inspetor.get_table_names())
+    if faltando:
+        raise ErroRestauracao(f'Backup sem as tabelas: {", ".join(sorted(faltando))}')
+
+
+def _migrar(url_preparacao):
+    """Cria as tabelas novas e aplica as migrações pendentes no banco de preparação."""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = url_preparacao
+    db.init_app(app)
+    with app.app_context():
+        try:
+            # Antes do create_all, que criaria vazias as tabelas que o backup não trouxe
+            _conferir_tabelas(inspect(db.engine), TABELAS_OBRIGATORIAS)
+            db.create_all()
+            aplicar_migracoes()
+        finally:
+            db.session.remove()
+            db.engine.dispose()
+
+
+def _validar(url_preparacao):
+    """Confere que o banco restaurado tem todas as tabelas e colunas dos modelos."""
+    motor = create_engine(url_preparacao)
+    try:
+        inspetor = inspect(motor)
+        _conferir_tabelas(inspetor, set(db.metadata.tables))
+        for tabela in db.metadata.sorted_tables:
+            existentes = {coluna['name'] for coluna in inspetor.get_columns(tabela.name)}
+            faltando = [coluna.name for coluna in tabela.columns if coluna.name not in existentes]
+            if faltando:
+                raise ErroRestauracao(f'Tabela {tabela.name} sem as colunas: {", ".join(faltando)}')
+    finally:
+        motor.dispose()
+
+
+def _trocar(url_manutencao, banco, preparacao, anterior):
+    motor = create_engine(url_manutencao, isolation_level='AUTOCOMMIT')
+    try:
+        with motor.connect() as conexao:
+            conexao.execute(text(f'DROP DATABASE IF EXISTS {_q(anterior)}'))
+            # Bloqueia novas conexões antes de derrubar as existentes
+            conexao.execute(text(f'ALTER DATABASE {_q(banco)} WITH ALLOW_CONNECTIONS false'))
+            conexao.execute(
+                text('SELECT pg_terminate_backend(pid) FROM pg_stat_activity '
+                     'WHERE datname = :banco AND pid <> pg_backend_pid()'),
+                {'banco': banco},
+            )
+            try:
+                conexao.execute(text(f'ALTER DATABASE {_q(banco)} RENAME TO {_q(anterior)}'))
+            except Exception:
+                conexao.execute(text(f'ALTER DATABASE {_q(banco)} WITH ALLOW_CONNECTIONS true'))
+                raise
+            try:
+                conexao.execute(text(f'ALTER DATABASE {_q(preparacao)} RENAME TO {_q(banco)}'))
+            except Exception:
+                # Devolve o nome ao banco original para a loja voltar a funcionar
+                conexao.execute(text(f'ALTER DATABASE {_q(anterior)} RENAME TO {_q(banco)}'))
+                conexao.execute(text(f'ALTER DATABASE {_q(banco)} WITH ALLOW_CONNECTIONS true'))
+                raise
+            conexao.execute(text(f'ALTER DATABASE {_q(anterior)} WITH ALLOW_CONNECTIONS true'))
+    finally:
+        motor.dispose()
+
+
+def restaurar(caminho, extensao, progresso):
+    """Restaura o backup em `caminho` (.dump ou .sql) e troca o banco atual por ele.
+
+    `progresso(etapa, percentual)` é chamado a cada etapa. Levanta
+    `ErroRestauracao` se algum passo falhar antes da troca.
+    """
+    url = db.engine.url
+    banco = url.database
+    preparacao, anterior = f'{banco}_restauracao', f'{banco}_anterior'
+    url_preparacao = url.set(database=preparacao).render_as_string(hide_password=False)
+    url_manutencao = url.set(database='postgres').render_as_string(hide_password=False)
+
+    progresso('preparando', 0)
+    _executar(['dropdb', *_conexao_pg(), '--if-exists', preparacao])
+    _executar(['createdb', *_conexao_pg(), preparacao])
+
+    progresso('restaurando', 0)
+    if extensao == '.dump':
+        _restaurar_dump(caminho, preparacao, progresso)
+    else:
+        _executar(['psql', *_conexao_pg(), '-d', preparacao, '-v', 'ON_ERROR_STOP=1', '-q', '-f', caminho])
+
+    progresso('migrando', 99)
+    _migrar(url_preparacao)
+
+    progresso('validando', 99)
+    _validar(url_preparacao)
+
+    progresso('trocando', 99)
+    db.session.remove()
+    db.engine.dispose()
+    _trocar(url_manutencao, banco, preparacao, anterior)
+    # Os contadores do backup podem coincidir com ETags já emitidos pelo banco anterior
+    versoes.nova_epoca()
+    cache_relatorios.limpar()
@@ -0,0 +1,351 @@
+"""Resumo diário dos relatórios.
+
+Cada venda, serviço finalizado, reposição e transação de caixa soma sua
+contribuição na linha do seu dia (data local da loja). Assim, um relatório de
+dia, mês ou ano lê no máximo 366 linhas em vez de varrer as tabelas brutas.
+
+O relatório de cada período ainda fica em cache (cache_relatorios.py) até que
+uma gravação confirmada altere algum dia do período. A série de tendência
+(`tendencia`) agrupa as mesmas linhas por dia, semana ou mês em uma consulta.
+"""
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+from sqlalchemy import event, func, case, cast, Date, DateTime, insert as sql_insert
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from models import db, Entrada, Saida, Servico, Caixa, ResumoDiario, ResumoPagamento
+from utils import data_local, dia_local_sql, FORMAS_PAGAMENTO
+import cache_relatorios
+
+# Formas sempre exibidas no relatório, mesmo sem movimento no período
+FORMAS_RELATORIO = ['dinheiro', 'pix', 'debito', 'credito']
+
+CAMPOS = [
+    'receita_produtos', 'custo_produtos', 'reposicoes',
+    'receita_manutencao', 'custo_manutencao',
+    'receita_reformas', 'custo_reformas',
+    'receita_revendas', 'custo_revendas',
+    'caixa_entradas', 'caixa_retiradas',
+]
+
+# Categorias da tendência -> (campo de receita, campo de custo) no resumo
+CATEGORIAS = {
+    'produtos': ('receita_produtos', 'custo_produtos'),
+    'manutencao': ('receita_manutencao', 'custo_manutencao'),
+    'reformas': ('receita_reformas', 'custo_reformas'),
+    'revendas': ('receita_revendas', 'custo_revendas'),
+}
+GRANULARIDADES = {'dia': 'day', 'semana': 'week', 'mes': 'month'}
+
+
+def _valor_servico(servico):
+    if servico.tipo == 'Venda de Aparelho':
+        return servico.preco_aparelho or 0.0
+    return (servico.mao_de_obra or 0.0) + (servico.custo_pecas or 0.0)
+
+
+def _contribuicao(obj):
+    """Retorna (dia, valores do resumo, valores por forma de pagamento) de um registro."""
+    if isinstance(obj, Saida):
+        valores = {
+            'receita_produtos': obj.total_venda,
+            'custo_produtos': obj.custo_unitario * obj.quantidade,
+        }
+        pagamentos = {obj.pagamento_codigo: obj.total_venda} if obj.pagamento_codigo else {}
+        return data_local(obj.data), valores, pagamentos
+
+    if isinstance(obj, Servico):
+        if obj.status != 'Finalizado':
+            return data_local(obj.data_hora), {}, {}
+        custo = obj.custo_pecas or 0.0
+        if obj.subtipo == 'Revenda':
+            valores = {'receita_revendas': obj.preco_aparelho or 0.0, 'custo_revendas': custo}
+        elif obj.subtipo == 'Manutenção':
+            valores = {'receita_manutencao': (obj.mao_de_obra or 0.0) + custo, 'custo_manutencao': custo}
+        elif obj.subtipo == 'Reforma':
+            valores = {'receita_reformas': obj.preco_aparelho or 0.0, 'custo_reformas': custo}
+        else:
+            valores = {}
+        pagamentos = {obj.pagamento_codigo: _valor_servico(obj)} if obj.pagamento_codigo else {}
+        return data_local(obj.data_hora), valores, pagamentos
+
+    if isinstance(obj, Entrada):
+        return data_local(obj.data), {'reposicoes': obj.total_custo}, {}
+
+    if isinstance(obj, Caixa):
+        campo = 'caixa_entradas' if obj.tipo == 'Entrada' else 'caixa_retiradas'
+        return data_local(obj.data), {campo: obj.valor}, {}
+
+    raise TypeError(f'Registro sem contribuição no resumo: {obj!r}')
+
+
+def _upsert(model, chave, valores):
+    """Soma `valores` na linha identificada por `chave`, criando-a se preciso."""
+    dialeto = db.session.get_bind().dialect.name
+    if dialeto == 'postgresql':
+        stmt = postgresql.insert(model)
+    elif dialeto == 'sqlite':
+        stmt = sqlite.insert(model)
+    else:
+        linha = db.session.get(model, tuple(chave.values()))
+        if linha is None:
+            db.session.add(model(**chave, **valores))
+        else:
+            for campo, valor in valores.items():
+                setattr(linha, campo, getattr(linha, campo) + valor)
+        return
+
+    stmt = stmt.values(**chave, **valores)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=list(chave),
+        set_={campo: getattr(model, campo) + stmt.excluded[campo] for campo in valores},
+    )
+    db.session.execute(stmt)
+
+
+def registrar(obj, sinal=1):
+    """Aplica a contribuição de um registro no resumo (sinal=-1 para removê-la).
+
+    Nas edições, chame com sinal=-1 antes de alterar o registro e novamente
+    com sinal=1 depois, para que o dia antigo e o novo fiquem corretos.
+    """
+    dia, valores, pagamentos = _contribuicao(obj)
+    somar(
+        dia,
+        {campo: sinal * valor for campo, valor in valores.items() if valor},
+        {forma: sinal * valor for forma, valor in pagamentos.items() if valor},
+    )
+
+
+def somar(dia, valores, pagamentos=None):
+    """Soma valores já agregados na linha do `dia` (ex.: uma importação em lote)."""
+    db.session.info.setdefault('dias_alterados', set()).add(dia)
+    valores = {campo: valor for campo, valor in valores.items() if valor}
+    if valores:
+        _upsert(ResumoDiario, {'dia': dia}, valores)
+    for forma, valor in (pagamentos or {}).items():
+        if valor:
+            _upsert(ResumoPagamento, {'dia': dia, 'forma': forma}, {'valor': valor})
+
+
+def totais_periodo(inicio, fim):
+    """Soma o resumo no intervalo de datas [inicio, fim)."""
+    filtro_dia = (ResumoDiario.dia >= inicio, ResumoDiario.dia < fim)
+    linha = db.session.query(
+        *[func.coalesce(func.sum(getattr(ResumoDiario, campo)), 0.0) for campo in CAMPOS]
+    ).filter(*filtro_dia).one()
+    totais = dict(zip(CAMPOS, linha))
+
+    pagamentos = dict(
+        db.session.query(ResumoPagamento.forma, func.sum(ResumoPagamento.valor))
+        .filter(ResumoPagamento.dia >= inicio, ResumoPagamento.dia < fim)
+        .group_by(ResumoPagamento.forma)
+        .all()
+    )
+    totais['pagamentos'] = {p: pagamentos.get(p) or 0.0 for p in FORMAS_RELATORIO}
+    totais['pagamentos'].update({p: v for p, v in pagamentos.items() if p not in FORMAS_RELATORIO and v})
+    return totais
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidar_cache(sessao):
+    dias = sessao.info.pop('dias_alterados', None)
+    if dias:
+        cache_relatorios.invalidar(dias)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _descartar_dias(sessao):
+    sessao.info.pop('dias_alterados', None)
+
+
+def _calcular_relatorio(inicio, fim):
+    totais = totais_periodo(inicio, fim)
+    relatorio = {
+        'totais_pagamento': [(FORMAS_PAGAMENTO.get(codigo, codigo), valor)
+                             for codigo, valor in totais['pagamentos'].items()],
+        'receita_total_produtos': totais['receita_produtos'],
+        'custo_total_produtos': totais['custo_produtos'],
+        'valor_gasto_reposicoes': totais['reposicoes'],
+        'receita_revendas': totais['receita_revendas'],
+        'custo_revendas': totais['custo_revendas'],
+        # Manutenção e reformas aparecem juntas no relatório
+        'receita_outros_servicos': totais['receita_manutencao'] + totais['receita_reformas'],
+        'custo_outros_servicos': totais['custo_manutencao'] + totais['custo_reformas'],
+    }
+    relatorio['lucro_produtos'] = relatorio['receita_total_produtos'] - relatorio['custo_total_produtos']
+    relatorio['lucro_revendas'] = relatorio['receita_revendas'] - relatorio['custo_revendas']
+    relatorio['lucro_outros_servicos'] = relatorio['receita_outros_servicos'] - relatorio['custo_outros_servicos']
+    return relatorio
+
+
+def relatorio_periodo(inicio, fim):
+    """Valores do relatório no intervalo [inicio, fim), do cache quando possível."""
+    dados = cache_relatorios.obter(inicio, fim)
+    if dados is None:
+        calculado_em = time.time()
+        dados = _calcular_relatorio(inicio, fim)
+        cache_relatorios.guardar(inicio, fim, dados, calculado_em)
+    return dados
+
+
+def inicio_periodo(dia, granularidade):
+    """Primeiro dia do dia/semana (segunda-feira)/mês que contém `dia`."""
+    if granularidade == 'semana':
+        return dia - timedelta(days=dia.weekday())
+    if granularidade == 'mes':
+        return dia.replace(day=1)
+    return dia
+
+
+def _proximo_periodo(inicio, granularidade):
+    if granularidade == 'semana':
+        return inicio + timedelta(days=7)
+    if granularidade == 'mes':
+        return date(inicio.year + inicio.month // 12, inicio.month % 12 + 1, 1)
+    return inicio + timedelta(days=1)
+
+
+def _periodo_sql(granularidade, dialeto):
+    """Expressão do primeiro dia do período de `ResumoDiario.dia` (já na data local da loja)."""
+    if granularidade == 'dia':
+        return ResumoDiario.dia
+    if dialeto == 'postgresql':
+        return cast(func.date_trunc(GRANULARIDADES[granularidade], cast(ResumoDiario.dia, DateTime)), Date)
+    if granularidade == 'semana':
+        return func.date(ResumoDiario.dia, '-6 days', 'weekday 1')
+    return func.date(ResumoDiario.dia, 'start of month')
+
+
+def tendencia(inicio, fim, granularidade='mes'):
+    """Série por dia, semana ou mês no intervalo [inicio, fim).
+
+    Devolve listas alinhadas com `periodos`: receita, custo e lucro de cada
+    categoria, reposições e o fluxo do caixa. Períodos sem movimento entram
+    com zero, para o gráfico não pular datas.
+    """
+    periodo = _periodo_sql(granularidade, db.session.get_bind().dialect.name)
+    linhas = (
+        db.session.query(periodo, *[func.sum(getattr(ResumoDiario, campo)) for campo in CAMPOS])
+        .filter(ResumoDiario.dia >= inicio, ResumoDiario.dia < fim)
+        .group_by(periodo)
+        .all()
+    )
+    valores = {_como_data(linha[0]): dict(zip(CAMPOS, linha[1:])) for linha in linhas}
+
+    periodos = []
+    atual = inicio_periodo(inicio, granularidade)
+    while atual < fim:
+        periodos.append(atual)
+        atual = _proximo_periodo(atual, granularidade)
+
+    def serie(campo):
+        return [round(valores.get(p, {}).get(campo) or 0.0, 2) for p in periodos]
+
+    categorias = {}
+    for categoria, (receita, custo) in CATEGORIAS.items():
+        receitas, custos = serie(receita), serie(custo)
+        categorias[categoria] = {'receita': receitas, 'custo': custos,
+                                 'lucro': [round(r - c, 2) for r, c in zip(receitas, custos)]}
+    entradas, retiradas = serie('caixa_entradas'), serie('caixa_retiradas')
+    return {
+        'granularidade': granularidade,
+        'periodos': [p.isoformat() for p in periodos],
+        'categorias': categorias,
+        'reposicoes': serie('reposicoes'),
+        'caixa': {'entradas': entradas, 'retiradas': retiradas,
+                  'saldo': [round(e - r, 2) for e, r in zip(entradas, retiradas)]},
+    }
+
+
+def _como_data(valor):
+    # SQLite devolve date() como texto
+    return date.fromisoformat(valor) if isinstance(valor, str) else valor
+
+
+def reconstruir_resumo():
+    """Recalcula todo o resumo a partir das tabelas brutas.
+
+    Usa uma consulta agrupada por dia para cada tabela de origem.
+    """
+    dialeto = db.session.get_bind().dialect.name
+    dias = defaultdict(lambda: dict.fromkeys(CAMPOS, 0.0))
+    pagamentos = defaultdict(float)
+
+    def somar(consulta, campos):
+        for linha in consulta:
+            dia = _como_data(linha[0])
+            for campo, valor in zip(campos, linha[1:]):
+                dias[dia][campo] += valor or 0.0
+
+    def somar_pagamentos(model, dia, valor, *filtros):
+        consulta = (
+            db.session.query(dia, model.pagamento_codigo, func.sum(valor))
+            .filter(model.pagamento_codigo.isnot(None), *filtros)
+            .group_by(dia, model.pagamento_codigo)
+        )
+        for dia_linha, codigo, total in consulta:
+            if total:
+                pagamentos[(_como_data(dia_linha), codigo)] += total
+
+    # Vendas de produtos
+    dia = dia_local_sql(Saida.data, dialeto)
+    somar(
+        db.session.query(dia, func.sum(Saida.total_venda), func.sum(Saida.quantidade * Saida.custo_unitario)).group_by(dia),
+        ['receita_produtos', 'custo_produtos'],
+    )
+    somar_pagamentos(Saida, dia, Saida.total_venda)
+
+    # Reposições
+    dia = dia_local_sql(Entrada.data, dialeto)
+    somar(db.session.query(dia, func.sum(Entrada.total_custo)).group_by(dia), ['reposicoes'])
+
+    # Serviços finalizados
+    dia = dia_local_sql(Servico.data_hora, dialeto)
+    revenda = Servico.subtipo == 'Revenda'
+    manutencao = Servico.subtipo == 'Manutenção'
+    reforma = Servico.subtipo == 'Reforma'
+    custo = func.coalesce(Servico.custo_pecas, 0.0)
+    mao_de_obra = func.coalesce(Servico.mao_de_obra, 0.0)
+    preco_aparelho = func.coalesce(Servico.preco_aparelho, 0.0)
+    finalizados = Servico.status == 'Finalizado'
+    somar(
+        db.session.query(
+            dia,
+            func.sum(case((manutencao, mao_de_obra + custo), else_=0.0)),
+            func.sum(case((manutencao, custo), else_=0.0)),
+            func.sum(case((reforma, preco_aparelho), else_=0.0)),
+            func.sum(case((reforma, custo), else_=0.0)),
+            func.sum(case((revenda, preco_aparelho), else_=0.0)),
+            func.sum(case((revenda, custo), else_=0.0)),
+        ).filter(finalizados).group_by(dia),
+        ['receita_manutencao', 'custo_manutencao', 'receita_reformas', 'custo_reformas',
+         'receita_revendas', 'custo_revendas'],
+    )
+    valor_servico = case((Servico.tipo == 'Venda de Aparelho', preco_aparelho), else_=mao_de_obra + custo)
+    somar_pagamentos(Servico, dia, valor_servico, finalizados)
+
+    # Caixa
+    dia = dia_local_sql(Caixa.data, dialeto)
+    somar(
+        db.session.query(
+            dia,
+            func.sum(case((Caixa.tipo == 'Entrada', Caixa.valor), else_=0.0)),
+            func.sum(case((Caixa.tipo == 'Entrada', 0.0), else_=Caixa.valor)),
+        ).group_by(dia),
+        ['caixa_entradas', 'caixa_retiradas'],
+    )
+
+    db.session.query(ResumoPagamento).delete()
+    db.session.query(ResumoDiario).delete()
+    if dias:
+        db.session.execute(sql_insert(ResumoDiario), [{'dia': dia, **valores} for dia, valores in dias.items()])
+    if pagamentos:
+        db.session.execute(
+            sql_insert(ResumoPagamento),
+            [{'dia': dia, 'forma': forma, 'valor': valor} for (dia, forma), valor in pagamentos.items()],
+        )
+    db.session.commit()
+    cache_relatorios.limpar()
+    return len(dias)
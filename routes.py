@@ -1,15 +1,33 @@
-from flask import render_template, request, redirect, url_for, flash, send_file, Blueprint, jsonify
-from sqlalchemy import extract, text, func, case
-from datetime import datetime
-from models import db, Produto, Entrada, Saida, Servico, Caixa
+from flask import render_template, request, redirect, url_for, flash, Blueprint, jsonify, Response, stream_with_context, \
+    abort, send_file
+from sqlalchemy import text
+from datetime import datetime, date, timedelta, timezone
+from models import db, Produto, Entrada, Saida, Servico, Caixa, Tarefa
 from flask_login import login_required
-from utils import filtros_data, to_float
+from utils import agora_local, filtros_data, periodo_local, subtipo_servico, to_float, ANO_MINIMO, ANO_MAXIMO
+from busca import buscar_produtos
+import consultas
+import resumo
+import livro_caixa
+import inventario
+import versoes
+import importacao
+import exportacao
+import backup
+import tarefas
+import vendas
+import conexao
 import os
-import subprocess
-import tempfile
+import uuid
 
 main_bp = Blueprint('main', __name__)
 
+@main_bp.errorhandler(inventario.EstoqueInsuficiente)
+def estoque_insuficiente(e):
+    db.session.rollback()
+    flash(str(e), 'danger')
+    return redirect(request.referrer or url_for('main.index'))
+
 @main_bp.route('/')
 @login_required
 def index():
@@ -17,6 +35,8 @@ def index():
 
 @main_bp.route('/produtos', methods=['GET', 'POST'])
 @login_required
+@conexao.repetir_leitura
+@versoes.condicional('produtos')
 def produtos():
     if request.method == 'POST':
         # Lógica para adicionar novo produto (inalterada)
@@ -25,36 +45,28 @@ def produtos():
         custo = float(request.form['custo'])
         estoque = int(request.form['estoque'])
         novo_produto = Produto(nome=nome, tipo="Produto", preco_venda=preco_venda, custo=custo, estoque=estoque)
-        db.session.add(novo_produto)
+        inventario.adicionar_produto(novo_produto)
         db.session.commit()
         flash('Produto adicionado com sucesso!', 'success')
         return redirect(url_for('main.produtos'))
     
-    page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor')
     query = request.args.get('q')
     
-    if query:
-        produtos_query = Produto.query.filter(Produto.nome.ilike(f'%{query}%'))
-    else:
-        produtos_query = Produto.query
-
-    pagination = produtos_query.order_by(Produto.nome).paginate(page=page, per_page=20, error_out=False)
+    pagination = consultas.listar_produtos(cursor, q=query)
     produtos_paginados = pagination.items
 
-    if request.args.get('page'): # Se for uma requisição AJAX para "Ver Mais"
+    if cursor: # Se for uma requisição AJAX para "Ver Mais"
         table_html = render_template('partials/_produtos_lista.html', produtos=produtos_paginados)
-        modals_html = render_template('partials/_produtos_modals.html', produtos=produtos_paginados)
         return jsonify({
             'table_html': table_html,
-            'modals_html': modals_html,
-            'has_next': pagination.has_next
+            'has_next': pagination.has_next,
+            'next_cursor': pagination.next_cursor
         })
 
-    # Para a carga inicial da página, calculamos os totais com base em todos os produtos filtrados
-    produtos_totais = produtos_query.all()
-    custo_total_estoque = sum(p.custo * p.estoque for p in produtos_totais)
-    valor_total_estoque = sum(p.preco_venda * p.estoque for p in produtos_totais)
-    
+    # Para a carga inicial da página, os totais dos produtos filtrados são somados no banco
+    custo_total_estoque, valor_total_estoque = inventario.valor_estoque(*consultas.filtros_produtos(query))
+
     return render_template('produtos.html', 
                            produtos=produtos_paginados, 
                            pagination=pagination,
@@ -62,8 +74,38 @@ def produtos():
                            valor_total_estoque=valor_total_estoque,
                            query=query)
 
+@main_bp.route('/produtos/<int:id>')
+@login_required
+def produto_detalhe(id):
+    """Dados de um produto para preencher o modal de edição."""
+    return jsonify(Produto.query.get_or_404(id).to_dict())
+
+@main_bp.route('/produtos/busca')
+@login_required
+@conexao.repetir_leitura
+def produtos_busca():
+    """Produtos para o campo de seleção com pesquisa (typeahead) das entradas e saídas."""
+    termo = request.args.get('q', '').strip()
+    limite = min(request.args.get('limite', 10, type=int), 50)
+
+    if termo:
+        encontrados = buscar_produtos(termo, limite)
+    else:
+        encontrados = Produto.query.order_by(Produto.nome, Produto.id).limit(limite).all()
+
+    response = jsonify({'produtos': [
+        {'id': p.id, 'nome': p.nome, 'preco_venda': p.preco_venda, 'custo': p.custo, 'estoque': p.estoque}
+        for p in encontrados
+    ]})
+    # Resultados podem ser reaproveitados pelo navegador por pouco tempo (o estoque muda)
+    response.headers['Cache-Control'] = 'private, max-age=30'
+    response.vary.add('Cookie')
+    return response
+
 @main_bp.route('/entradas', methods=['GET', 'POST'])
 @login_required
+@conexao.repetir_leitura
+@versoes.condicional('entradas', 'produtos')
 def entradas():
     if request.method == 'POST':
         # Lógica para adicionar nova entrada (inalterada)
@@ -72,46 +114,48 @@ def entradas():
         custo_unitario = float(request.form['custo_unitario'])
         total_custo = quantidade * custo_unitario
 
-        produto = Produto.query.get(produto_id)
-        produto.estoque += quantidade
+        inventario.movimentar(produto_id, quantidade)
 
         nova_entrada = Entrada(produto_id=produto_id, quantidade=quantidade, custo_unitario=custo_unitario, total_custo=total_custo)
         db.session.add(nova_entrada)
+        db.session.flush()
+        resumo.registrar(nova_entrada)
         db.session.commit()
         flash('Entrada registrada com sucesso!', 'success')
         return redirect(url_for('main.entradas'))
 
-    page = request.args.get('page', 1, type=int)
-    pagination = Entrada.query.order_by(Entrada.data.desc()).paginate(page=page, per_page=20, error_out=False)
+    cursor = request.args.get('cursor')
+    pagination = consultas.listar_entradas(cursor)
     entradas_paginadas = pagination.items
 
-    if request.args.get('page'): # Requisição AJAX
+    if cursor: # Requisição AJAX
         table_html = render_template('partials/_entradas_lista.html', entradas=entradas_paginadas)
-        modals_html = render_template('partials/_entradas_modals.html', entradas=entradas_paginadas)
         return jsonify({
             'table_html': table_html,
-            'modals_html': modals_html,
-            'has_next': pagination.has_next
+            'has_next': pagination.has_next,
+            'next_cursor': pagination.next_cursor
         })
 
     # Carga inicial da página
-    produtos_all = Produto.query.order_by(Produto.nome).all()
-    
-    mes_atual = datetime.now().month
-    ano_atual = datetime.now().year
+    hoje = agora_local()
     valor_gasto_reposicoes = db.session.query(db.func.sum(Entrada.total_custo)).filter(
-        extract('month', Entrada.data) == mes_atual,
-        extract('year', Entrada.data) == ano_atual
+        *filtros_data(Entrada, 'data', mes=hoje.month, ano=hoje.year)
     ).scalar() or 0
     
     return render_template('entradas.html', 
                            entradas=entradas_paginadas, 
                            pagination=pagination,
-                           produtos_all=produtos_all, 
                            valor_gasto_reposicoes=valor_gasto_reposicoes)
 
+@main_bp.route('/entradas/<int:id>')
+@login_required
+def entrada_detalhe(id):
+    return jsonify(Entrada.query.get_or_404(id).to_dict())
+
 @main_bp.route('/saidas', methods=['GET', 'POST'])
 @login_required
+@conexao.repetir_leitura
+@versoes.condicional('saidas', 'produtos')
 def saidas():
     if request.method == 'POST':
         # Lógica para adicionar nova saída (inalterada)
@@ -122,58 +166,109 @@ def saidas():
         forma_pagamento = request.form['forma_pagamento']
         cliente = request.form['cliente']
 
-        produto = Produto.query.get(produto_id)
-        produto.estoque -= quantidade
+        produto = inventario.movimentar(produto_id, -quantidade)
 
-        nova_saida = Saida(produto_id=produto_id, quantidade=quantidade, preco_unitario=preco_unitario, total_venda=total_venda, forma_pagamento=forma_pagamento, cliente=cliente)
+        nova_saida = Saida(produto_id=produto_id, quantidade=quantidade, preco_unitario=preco_unitario, custo_unitario=produto.custo, total_venda=total_venda, forma_pagamento=forma_pagamento, cliente=cliente)
         db.session.add(nova_saida)
         db.session.flush() # Garante que nova_saida.id esteja disponível
+        resumo.registrar(nova_saida)
 
-        if forma_pagamento and forma_pagamento.lower() == 'dinheiro':
-            entrada_caixa = Caixa(
+        if nova_saida.pagamento_codigo == 'dinheiro':
+            livro_caixa.lancar(
                 tipo='Entrada',
                 valor=total_venda,
                 descricao=f'Venda: {produto.nome}',
                 origem_id=nova_saida.id,
                 origem_tipo='saida'
             )
-            db.session.add(entrada_caixa)
 
         db.session.commit()
         flash('Saída registrada com sucesso!', 'success')
         return redirect(url_for('main.saidas'))
 
-    page = request.args.get('page', 1, type=int)
-    pagination = Saida.query.order_by(Saida.data.desc()).paginate(page=page, per_page=20, error_out=False)
+    cursor = request.args.get('cursor')
+    pagination = consultas.listar_saidas(cursor)
     saidas_paginadas = pagination.items
 
-    if request.args.get('page'): # Requisição AJAX
+    if cursor: # Requisição AJAX
         table_html = render_template('partials/_saidas_lista.html', saidas=saidas_paginadas)
-        modals_html = render_template('partials/_saidas_modals.html', saidas=saidas_paginadas)
         return jsonify({
             'table_html': table_html,
-            'modals_html': modals_html,
-            'has_next': pagination.has_next
+            'has_next': pagination.has_next,
+            'next_cursor': pagination.next_cursor
         })
 
     # Carga inicial da página
-    produtos_all = Produto.query.order_by(Produto.nome).all()
     return render_template('saidas.html', 
                            saidas=saidas_paginadas, 
-                           pagination=pagination,
-                           produtos_all=produtos_all)
+                           pagination=pagination)
+
 
 
 
+@main_bp.route('/entradas/importar', methods=['POST'])
+@login_required
+def importar_entradas():
+    arquivo = request.files.get('arquivo')
+    if not arquivo or not arquivo.filename.lower().endswith('.csv'):
+        flash('Envie um arquivo .csv.', 'danger')
+        return redirect(url_for('main.entradas'))
+
+    resultado = importacao.importar_entradas(arquivo.stream)
+
+    if resultado.importadas:
+        flash(f'{resultado.importadas} entradas importadas ({resultado.produtos_criados} produtos novos).', 'success')
+    for linha, erro in resultado.erros[:20]:
+        flash(f'Linha {linha}: {erro}', 'warning')
+    if len(resultado.erros) > 20:
+        flash(f'... e mais {len(resultado.erros) - 20} linhas com erro.', 'warning')
+    return redirect(url_for('main.entradas'))
+
+
+@main_bp.route('/saidas/<int:id>')
+@login_required
+def saida_detalhe(id):
+    return jsonify(Saida.query.get_or_404(id).to_dict())
+
+
+@main_bp.route('/vendas', methods=['POST'])
+@login_required
+def registrar_venda():
+    """Venda com vários itens (carrinho): listas paralelas produto_id, quantidade e preco_unitario."""
+    listas = (request.form.getlist('produto_id'), request.form.getlist('quantidade'),
+              request.form.getlist('preco_unitario'))
+    try:
+        # Listas de tamanhos diferentes: algum item chegou incompleto
+        if len({len(lista) for lista in listas}) != 1:
+            raise ValueError
+        itens = [
+            (int(produto_id), int(quantidade), float(preco_unitario))
+            for produto_id, quantidade, preco_unitario in zip(*listas)
+        ]
+    except ValueError:
+        flash('Venda não registrada: preencha produto, quantidade e preço de todos os itens.', 'danger')
+        return redirect(url_for('main.saidas'))
+    try:
+        venda = vendas.registrar(itens, request.form.get('forma_pagamento', ''), request.form.get('cliente', ''))
+    except (ValueError, LookupError) as e:
+        db.session.rollback()
+        flash(f'Venda não registrada: {e}', 'danger')
+        return redirect(url_for('main.saidas'))
+    db.session.commit()
+    flash(f'Venda #{venda.id} registrada com {len(itens)} itens!', 'success')
+    return redirect(url_for('main.saidas'))
 
 @main_bp.route('/relatorios')
 @login_required
+@conexao.repetir_leitura
+@versoes.condicional('saidas', 'servicos', 'entradas', 'caixa', 'resumo_diario', 'resumo_pagamentos')
 def relatorios():
-    now = datetime.now()
+    now = agora_local()
     mes = request.args.get('mes', default=now.month, type=int)
     ano = request.args.get('ano', default=now.year, type=int)
 
-    mes_inteiro = 'mes_inteiro' in request.args
+    ano_inteiro = 'ano_inteiro' in request.args
+    mes_inteiro = ano_inteiro or 'mes_inteiro' in request.args
 
     if mes_inteiro:
         dia = None
@@ -181,92 +276,30 @@ def relatorios():
         dia = request.args.get('dia', type=int)
         dia = dia if dia and 1 <= dia <= 31 else now.day
 
-    # Filtros
-    filtros_saida = filtros_data(Saida, 'data', dia, mes, ano)
-    filtros_entrada = filtros_data(Entrada, 'data', dia, mes, ano)
-    filtros_servico = filtros_data(Servico, 'data_hora', dia, mes, ano) + [Servico.status == 'Finalizado']
+    if not ANO_MINIMO <= ano <= ANO_MAXIMO:
+        ano = now.year
+    if ano_inteiro:
+        mes = None
+    elif not 1 <= mes <= 12:
+        mes = now.month
+
+    # Os totais do período saem do resumo diário, em cache até o período ser alterado
+    inicio, fim = periodo_local(dia, mes, ano)
+    relatorio = resumo.relatorio_periodo(inicio, fim)
 
-    # --- Cálculos de Caixa e Pagamentos (Período Filtrado e Totais) ---
     # Saldo total do caixa (não é afetado pelo filtro de data)
-    total_entradas_caixa = db.session.query(func.sum(Caixa.valor)).filter(Caixa.tipo == 'Entrada').scalar() or 0.0
-    total_retiradas_caixa = db.session.query(func.sum(Caixa.valor)).filter(Caixa.tipo == 'Retirada').scalar() or 0.0
-    saldo_caixa = total_entradas_caixa - total_retiradas_caixa
-
-    # Totais por forma de pagamento (afetados pelo filtro de data)
-    pagamentos = ['dinheiro', 'pix', 'crédito', 'débito']
-    totais_pagamento = {}
-    for p in pagamentos:
-        total_saidas = db.session.query(func.sum(Saida.total_venda)).filter(*filtros_saida, Saida.forma_pagamento.ilike(f'%{p}%')).scalar() or 0.0
-        
-        total_servicos_query = db.session.query(func.sum(
-            case(
-                (Servico.tipo == 'Venda de Aparelho', Servico.preco_aparelho),
-                else_=Servico.mao_de_obra + Servico.custo_pecas
-            )
-        )).filter(*filtros_servico, Servico.forma_pagamento.ilike(f'%{p}%')).scalar() or 0.0
-        
-        totais_pagamento[p] = total_saidas + total_servicos_query
-
-    # Produtos
-    saidas_no_periodo = Saida.query.filter(*filtros_saida).all()
-    receita_total_produtos = db.session.query(db.func.sum(Saida.total_venda)).filter(*filtros_saida).scalar() or 0
-    custo_total_produtos = sum(saida.produto.custo * saida.quantidade for saida in saidas_no_periodo)
-    lucro_produtos = receita_total_produtos - custo_total_produtos
-
-    # Reposições
-    valor_gasto_reposicoes = db.session.query(db.func.sum(Entrada.total_custo)).filter(*filtros_entrada).scalar() or 0
-
-    # Serviços
-    servicos_finalizados = Servico.query.filter(*filtros_servico).all()
-    servicos_revenda = [s for s in servicos_finalizados if s.servico_descricao.startswith('[REVENDA]')]
-    outros_servicos = [s for s in servicos_finalizados if not s.servico_descricao.startswith('[REVENDA]')]
-
-    # Revenda
-    receita_revendas = sum(s.preco_aparelho for s in servicos_revenda)
-    custo_revendas = sum(s.custo_pecas for s in servicos_revenda)
-    lucro_revendas = receita_revendas - custo_revendas
-
-    # Manutenção e Reforma
-    receita_manutencao = custo_manutencao = lucro_manutencao = 0
-    receita_reformas = custo_reformas = lucro_reformas = 0
-
-    for s in outros_servicos:
-        if s.tipo == 'Manutenção':
-            receita_manutencao += s.mao_de_obra + s.custo_pecas
-            custo_manutencao += s.custo_pecas
-            lucro_manutencao += s.mao_de_obra
-        elif s.tipo == 'Venda de Aparelho':
-            receita_reformas += s.preco_aparelho
-            custo_reformas += s.custo_pecas
-            lucro_reformas += s.preco_aparelho - s.custo_pecas
-
-    # Totais combinados (manutenção + reformas)
-    receita_outros_servicos = receita_manutencao + receita_reformas
-    custo_outros_servicos = custo_manutencao + custo_reformas
-    lucro_outros_servicos = lucro_manutencao + lucro_reformas
+    saldo_caixa = livro_caixa.saldo_atual()
 
     return render_template(
         'relatorios.html',
         saldo_caixa=saldo_caixa,
-        totais_pagamento=totais_pagamento,
-        receita_total_produtos=receita_total_produtos,
-        custo_total_produtos=custo_total_produtos,
-        lucro_produtos=lucro_produtos,
-        valor_gasto_reposicoes=valor_gasto_reposicoes,
-
-        receita_outros_servicos=receita_outros_servicos,
-        custo_outros_servicos=custo_outros_servicos,
-        lucro_outros_servicos=lucro_outros_servicos,
-
-        receita_revendas=receita_revendas,
-        custo_revendas=custo_revendas,
-        lucro_revendas=lucro_revendas,
-
+        **relatorio,
         dia=dia,
         mes=mes,
         ano=ano,
         now=now,
-        mes_inteiro=mes_inteiro
+        mes_inteiro=mes_inteiro,
+        ano_inteiro=ano_inteiro
     )
 
 
@@ -274,11 +307,13 @@ def relatorios():
 @main_bp.route('/edit_product/<int:id>', methods=['POST'])
 @login_required
 def edit_product(id):
-    produto = Produto.query.get_or_404(id)
+    # Trava a linha: o novo estoque é absoluto e o ajuste do inventário depende do valor atual
+    produto = Produto.query.with_for_update().filter_by(id=id).first_or_404()
     produto.nome = request.form['nome']
-    produto.preco_venda = float(request.form['preco_venda'])
-    produto.custo = float(request.form['custo'])
-    produto.estoque = int(request.form['estoque'])
+    inventario.atualizar_produto(produto,
+                                 preco_venda=float(request.form['preco_venda']),
+                                 custo=float(request.form['custo']),
+                                 estoque=int(request.form['estoque']))
     db.session.commit()
     flash('Produto atualizado com sucesso!', 'success')
     return redirect(url_for('main.produtos'))
@@ -298,7 +333,7 @@ def delete_produto(id):
 
     is_last_product = Produto.query.count() == 1
 
-    db.session.delete(produto)
+    inventario.remover_produto(produto)
     db.session.commit()
 
     if is_last_product:
@@ -317,16 +352,17 @@ def delete_produto(id):
 @login_required
 def edit_entrada(id):
     entrada = Entrada.query.get_or_404(id)
-    produto = Produto.query.get(entrada.produto_id)
+    resumo.registrar(entrada, -1)
 
     quantidade_antiga = entrada.quantidade
     quantidade_nova = int(request.form['quantidade'])
-    produto.estoque = produto.estoque - quantidade_antiga + quantidade_nova
+    inventario.movimentar(entrada.produto_id, quantidade_nova - quantidade_antiga)
 
     entrada.quantidade = quantidade_nova
     entrada.custo_unitario = float(request.form['custo_unitario'])
     entrada.total_custo = entrada.quantidade * entrada.custo_unitario
-    
+    resumo.registrar(entrada)
+
     db.session.commit()
     flash('Entrada atualizada com sucesso!', 'success')
     return redirect(url_for('main.entradas'))
@@ -336,8 +372,8 @@ def edit_entrada(id):
 @login_required
 def delete_entrada(id):
     entrada = Entrada.query.get_or_404(id)
-    produto = Produto.query.get(entrada.produto_id)
-    produto.estoque -= entrada.quantidade
+    inventario.movimentar(entrada.produto_id, -entrada.quantidade)
+    resumo.registrar(entrada, -1)
     db.session.delete(entrada)
     db.session.commit()
     flash('Entrada deletada com sucesso!', 'success')
@@ -356,16 +392,15 @@ def get_total_servico(servico):
 
 @main_bp.route('/servicos', methods=['GET', 'POST'])
 @login_required
+@conexao.repetir_leitura
+@versoes.condicional('servicos')
 def servicos():
     if request.method == 'POST':
         # Lógica para adicionar novo serviço (inalterada)
         servico_descricao = request.form['servico_descricao']
         aparelho = request.form.get('aparelho')
         tipo = request.form.get('tipo')
-        subtipo_venda = request.form.get('subtipo_venda')
-
-        if tipo == 'Venda de Aparelho' and subtipo_venda == 'Revenda':
-            servico_descricao = f"[REVENDA] {servico_descricao}"
+        subtipo = subtipo_servico(tipo, request.form.get('subtipo_venda'))
 
         status = request.form['status']
         custo_pecas = float(request.form.get('custo_pecas', 0.0))
@@ -380,38 +415,37 @@ def servicos():
         forma_pagamento = request.form.get('forma_pagamento')
         cliente = request.form.get('cliente')
 
-        novo_servico = Servico(servico_descricao=servico_descricao, aparelho=aparelho, tipo=tipo,
+        novo_servico = Servico(servico_descricao=servico_descricao, aparelho=aparelho, tipo=tipo, subtipo=subtipo,
                                custo_pecas=custo_pecas, mao_de_obra=mao_de_obra,
                                preco_aparelho=preco_aparelho, status=status, forma_pagamento=forma_pagamento, cliente=cliente)
         db.session.add(novo_servico)
         db.session.flush()
+        resumo.registrar(novo_servico)
 
-        if status == 'Finalizado' and forma_pagamento and forma_pagamento.lower() == 'dinheiro':
+        if status == 'Finalizado' and novo_servico.pagamento_codigo == 'dinheiro':
             valor_total = get_total_servico(novo_servico)
-            entrada_caixa = Caixa(
+            livro_caixa.lancar(
                 tipo='Entrada',
                 valor=valor_total,
-                descricao=f'Serviço: {novo_servico.servico_descricao.replace("[REVENDA]", "").strip()}',
+                descricao=f'Serviço: {novo_servico.servico_descricao}',
                 origem_id=novo_servico.id,
                 origem_tipo='servico'
             )
-            db.session.add(entrada_caixa)
 
         db.session.commit()
         flash('Serviço adicionado com sucesso!', 'success')
         return redirect(url_for('main.servicos'))
 
-    page = request.args.get('page', 1, type=int)
-    pagination = Servico.query.order_by(Servico.data_hora.desc()).paginate(page=page, per_page=20, error_out=False)
+    cursor = request.args.get('cursor')
+    pagination = consultas.listar_servicos(cursor)
     servicos_paginados = pagination.items
 
-    if request.args.get('page'): # Requisição AJAX
+    if cursor: # Requisição AJAX
         table_html = render_template('partials/_servicos_lista.html', servicos=servicos_paginados)
-        modals_html = render_template('partials/_servicos_modals.html', servicos=servicos_paginados)
         return jsonify({
             'table_html': table_html,
-            'modals_html': modals_html,
-            'has_next': pagination.has_next
+            'has_next': pagination.has_next,
+            'next_cursor': pagination.next_cursor
         })
 
     # Carga inicial da página
@@ -420,8 +454,16 @@ def servicos():
                            pagination=pagination)
 
 
+@main_bp.route('/servicos/<int:id>')
+@login_required
+def servico_detalhe(id):
+    return jsonify(Servico.query.get_or_404(id).to_dict())
+
+
 @main_bp.route('/caixa', methods=['GET', 'POST'])
 @login_required
+@conexao.repetir_leitura
+@versoes.condicional('caixa')
 def caixa():
     if request.method == 'POST':
         # Lógica para adicionar transação (inalterada)
@@ -431,30 +473,26 @@ def caixa():
         if not valor or not descricao:
             flash('Valor e descrição são obrigatórios.', 'danger')
             return redirect(url_for('main.caixa'))
-        nova_transacao = Caixa(tipo=tipo, valor=valor, descricao=descricao)
-        db.session.add(nova_transacao)
+        livro_caixa.lancar(tipo=tipo, valor=valor, descricao=descricao)
         db.session.commit()
         flash(f'{tipo.capitalize()} registrada com sucesso!', 'success')
         return redirect(url_for('main.caixa'))
 
-    page = request.args.get('page', 1, type=int)
-    pagination = Caixa.query.order_by(Caixa.data.desc()).paginate(page=page, per_page=20, error_out=False)
+    cursor = request.args.get('cursor')
+    pagination = consultas.listar_caixa(cursor)
     transacoes_paginadas = pagination.items
 
-    if request.args.get('page'): # Requisição AJAX
+    if cursor: # Requisição AJAX
         table_html = render_template('partials/_caixa_lista.html', transacoes=transacoes_paginadas)
-        # Como não há modais, não precisamos de modals_html, mas a estrutura JSON é mantida
         return jsonify({
             'table_html': table_html,
-            'modals_html': '',
-            'has_next': pagination.has_next
+            'has_next': pagination.has_next,
+            'next_cursor': pagination.next_cursor
         })
 
     # Carga inicial da página
-    total_entradas = db.session.query(func.sum(Caixa.valor)).filter(Caixa.tipo == 'Entrada').scalar() or 0.0
-    total_retiradas = db.session.query(func.sum(Caixa.valor)).filter(Caixa.tipo == 'Retirada').scalar() or 0.0
-    saldo_caixa = total_entradas - total_retiradas
-    
+    saldo_caixa = livro_caixa.saldo_atual()
+
     return render_template('caixa.html', 
                            transacoes=transacoes_paginadas, 
                            pagination=pagination,
@@ -467,7 +505,7 @@ def delete_caixa(id):
     if transacao.origem_tipo:
         flash('Não é possível deletar uma transação automática.', 'danger')
     else:
-        db.session.delete(transacao)
+        livro_caixa.remover(transacao)
         db.session.commit()
         flash('Transação manual deletada com sucesso!', 'success')
     return redirect(url_for('main.caixa'))
@@ -500,6 +538,7 @@ def nota_produto(saida_id):
     telefone = os.getenv('TEL_LOJA', '00 00000-0000')
     return render_template('nota_produto.html',
                            saida=saida,
+                           itens=vendas.itens(saida),
                             cnpj=cnpj,
                             nome_loja=nome_loja,
                             telefone=telefone)
@@ -508,30 +547,36 @@ def nota_produto(saida_id):
 @login_required
 def edit_saida(id):
     saida = Saida.query.get_or_404(id)
-    produto = Produto.query.get(saida.produto_id)
+    resumo.registrar(saida, -1)
 
     quantidade_antiga = saida.quantidade
-    forma_pagamento_antiga = saida.forma_pagamento
+    pagamento_antigo = saida.pagamento_codigo
+    dinheiro_antigo = vendas.valor_em_dinheiro(saida)
     quantidade_nova = int(request.form['quantidade'])
-    produto.estoque = produto.estoque + quantidade_antiga - quantidade_nova
+    produto = inventario.movimentar(saida.produto_id, quantidade_antiga - quantidade_nova)
 
     saida.quantidade = quantidade_nova
     saida.preco_unitario = float(request.form['preco_unitario'])
     saida.total_venda = saida.quantidade * saida.preco_unitario
     saida.forma_pagamento = request.form['forma_pagamento']
     saida.cliente = request.form['cliente']
+    resumo.registrar(saida)
+
+    if saida.venda_id:
+        # Item de venda com vários itens: o caixa tem um único lançamento para a venda inteira
+        vendas.ajustar_caixa(saida, vendas.valor_em_dinheiro(saida) - dinheiro_antigo)
+    else:
+        transacao_caixa = Caixa.query.filter_by(origem_id=id, origem_tipo='saida').first()
+
+        if saida.pagamento_codigo == 'dinheiro':
+            if transacao_caixa:
+                livro_caixa.alterar_valor(transacao_caixa, saida.total_venda)
+            else:
+                livro_caixa.lancar(tipo='Entrada', valor=saida.total_venda, descricao=f'Venda: {produto.nome}', origem_id=id, origem_tipo='saida')
+        elif pagamento_antigo == 'dinheiro' and transacao_caixa:
+            livro_caixa.remover(transacao_caixa)
 
-    transacao_caixa = Caixa.query.filter_by(origem_id=id, origem_tipo='saida').first()
-    forma_pagamento_nova = saida.forma_pagamento
 
-    if forma_pagamento_nova and forma_pagamento_nova.lower() == 'dinheiro':
-        if transacao_caixa:
-            transacao_caixa.valor = saida.total_venda
-        else:
-            db.session.add(Caixa(tipo='Entrada', valor=saida.total_venda, descricao=f'Venda: {produto.nome}', origem_id=id, origem_tipo='saida'))
-    elif forma_pagamento_antiga and forma_pagamento_antiga.lower() == 'dinheiro' and transacao_caixa:
-        db.session.delete(transacao_caixa)
-    
     db.session.commit()
     flash('Saída atualizada com sucesso!', 'success')
     return redirect(url_for('main.saidas'))
@@ -541,33 +586,29 @@ def edit_saida(id):
 @login_required
 def delete_saida(id):
     saida = Saida.query.get_or_404(id)
-    produto = Produto.query.get(saida.produto_id)
-    produto.estoque += saida.quantidade
-    Caixa.query.filter_by(origem_id=id, origem_tipo='saida').delete()
+    inventario.movimentar(saida.produto_id, saida.quantidade)
+    if saida.venda_id:
+        vendas.ajustar_caixa(saida, -vendas.valor_em_dinheiro(saida))
+    for transacao in Caixa.query.filter_by(origem_id=id, origem_tipo='saida').all():
+        livro_caixa.remover(transacao)
+    resumo.registrar(saida, -1)
     db.session.delete(saida)
     db.session.commit()
     flash('Saída deletada com sucesso!', 'success')
     return redirect(url_for('main.saidas'))
 
-from datetime import datetime, timezone
-
 @main_bp.route('/edit_servico/<int:id>', methods=['POST'])
 @login_required
 def edit_servico(id):
     servico = Servico.query.get_or_404(id)
-    
+    resumo.registrar(servico, -1)
+
     # Guarda o status antigo para comparação
     status_antigo = servico.status
     
-    servico_descricao = request.form['servico_descricao'].replace('[REVENDA]', '').strip()
     tipo = request.form['tipo']
-    subtipo_venda = request.form.get(f'subtipo_venda_{id}')
-
-    if tipo == 'Venda de Aparelho' and subtipo_venda == 'Revenda':
-        servico.servico_descricao = f"[REVENDA] {servico_descricao}"
-    else:
-        servico.servico_descricao = servico_descricao
-
+    servico.servico_descricao = request.form['servico_descricao'].strip()
+    servico.subtipo = subtipo_servico(tipo, request.form.get('edit_subtipo_venda'))
     servico.aparelho = request.form.get('aparelho')
     servico.tipo = tipo
     servico.forma_pagamento = request.form.get('forma_pagamento')
@@ -593,18 +634,20 @@ def edit_servico(id):
         servico.data_hora = datetime.now(timezone.utc)
 
     servico.status = novo_status
+    resumo.registrar(servico)
 
     transacao_caixa = Caixa.query.filter_by(origem_id=id, origem_tipo='servico').first()
     valor_total = get_total_servico(servico)
 
-    if servico.status == 'Finalizado' and servico.forma_pagamento and servico.forma_pagamento.lower() == 'dinheiro':
+    if servico.status == 'Finalizado' and servico.pagamento_codigo == 'dinheiro':
         if transacao_caixa:
-            transacao_caixa.valor = valor_total
+            livro_caixa.alterar_valor(transacao_caixa, valor_total)
         else:
-            db.session.add(Caixa(tipo='Entrada', valor=valor_total, descricao=f'Serviço: {servico.servico_descricao.replace("[REVENDA]", "").strip()}', origem_id=id, origem_tipo='servico'))
+            livro_caixa.lancar(tipo='Entrada', valor=valor_total, descricao=f'Serviço: {servico.servico_descricao}', origem_id=id, origem_tipo='servico')
     elif transacao_caixa:
-        db.session.delete(transacao_caixa)
-    
+        livro_caixa.remover(transacao_caixa)
+
+
     db.session.commit()
     flash('Serviço atualizado com sucesso!', 'success')
     return redirect(url_for('main.servicos'))
@@ -612,129 +655,151 @@ def edit_servico(id):
 @main_bp.route('/delete_servico/<int:id>', methods=['POST'])
 @login_required
 def delete_servico(id):
-    Caixa.query.filter_by(origem_id=id, origem_tipo='servico').delete()
     servico = Servico.query.get_or_404(id)
+    for transacao in Caixa.query.filter_by(origem_id=id, origem_tipo='servico').all():
+        livro_caixa.remover(transacao)
+    resumo.registrar(servico, -1)
     db.session.delete(servico)
     db.session.commit()
     flash('Serviço deletado com sucesso!', 'success')
     return redirect(url_for('main.servicos'))
 
 
-@main_bp.route('/backup', methods=['GET'])
+@main_bp.route('/exportar/<recurso>')
 @login_required
-def backup_database():
-    db_user = os.getenv('DB_USER')
-    db_password = os.getenv('DB_PASSWORD')
-    db_host = os.getenv('DB_HOST')
-    db_name = os.getenv('DB_NAME')
-    db_port = os.getenv('DB_PORT')
+@conexao.tempo_limite(0)
+def exportar(recurso):
+    """CSV de saídas, entradas, serviços ou caixa entre as datas `inicio` e `fim` (inclusive)."""
+    parametros = _parametros_exportacao({**request.args, 'recurso': recurso})
+    if parametros is None:
+        return redirect(url_for('main.index'))
+    recurso, inicio, fim, separador, compactar, nome_arquivo = parametros
+    blocos = exportacao.linhas_csv(recurso, inicio, fim + timedelta(days=1), separador)
+    if compactar:
+        blocos = exportacao.compactar(blocos)
+        mimetype = 'application/gzip'
+    else:
+        mimetype = 'text/csv'
+
+    return Response(
+        stream_with_context(blocos),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename={nome_arquivo}'},
+    )
 
-    with tempfile.NamedTemporaryFile(mode='w+', delete=False, suffix='.sql') as temp_file:
-        backup_file_path = temp_file.name
 
+def _parametros_exportacao(valores):
+    """Recurso, período e opções do formulário de exportação; None se inválidos (já avisa o usuário)."""
+    recurso = valores.get('recurso')
+    if recurso not in exportacao.RECURSOS:
+        flash('Tipo de exportação inválido.', 'danger')
+        return None
     try:
-        os.environ['PGPASSWORD'] = db_password
-        
-        command = [
-            'pg_dump',
-            '-h', db_host,
-            '-p', db_port,
-            '-U', db_user,
-            '-F', 'p',
-            '-d', db_name,
-            '-f', backup_file_path
-        ]
-        
-        process = subprocess.run(command, check=True, capture_output=True)
-        flash('Backup do banco de dados criado com sucesso!', 'success')
-        return send_file(backup_file_path, as_attachment=True, download_name=f'smart_finance_backup_{datetime.now().strftime("%Y%m%d%H%M%S")}.sql')
-    except subprocess.CalledProcessError as e:
-        flash(f'Erro ao criar backup: {e.stderr.decode()}', 'danger')
+        inicio = date.fromisoformat(valores['inicio'])
+        fim = date.fromisoformat(valores['fim'])
+    except (KeyError, ValueError):
+        flash('Informe o período da exportação (data inicial e final).', 'danger')
+        return None
+    separador = ';' if valores.get('separador') == ';' else ','
+    nome_arquivo = f'{recurso}_{inicio.isoformat()}_{fim.isoformat()}.csv'
+    if valores.get('gzip'):
+        nome_arquivo += '.gz'
+    return recurso, inicio, fim, separador, bool(valores.get('gzip')), nome_arquivo
+
+
+@main_bp.route('/exportar', methods=['POST'])
+@login_required
+def exportar_em_segundo_plano():
+    """Enfileira a exportação para o worker; útil para períodos longos."""
+    parametros = _parametros_exportacao(request.form)
+    if parametros is None:
         return redirect(url_for('main.index'))
-    except Exception as e:
-        flash(f'Ocorreu um erro inesperado ao criar o backup: {str(e)}', 'danger')
+    recurso, inicio, fim, separador, compactar, nome_arquivo = parametros
+    tarefas.enfileirar('exportacao', nome_arquivo, recurso=recurso, inicio=inicio.isoformat(),
+                       fim=(fim + timedelta(days=1)).isoformat(), separador=separador, gzip=compactar)
+    flash('Exportação enviada para processamento. O arquivo aparece em "Tarefas" quando ficar pronto.', 'info')
+    return redirect(url_for('main.index'))
+
+
+@main_bp.route('/backup', methods=['POST'])
+@login_required
+def backup_database():
+    """Enfileira o backup: dump do PostgreSQL ou instantâneo .zip com CSVs."""
+    postgres = db.session.get_bind().dialect.name == 'postgresql'
+    formato = request.form.get('formato') or ('dump' if postgres else 'csv')
+    momento = datetime.now().strftime("%Y%m%d%H%M%S")
+
+    if formato == 'csv':
+        tarefas.enfileirar('backup', f'smart_finance_csv_{momento}.zip', formato='csv')
+    elif not postgres:
+        flash('O backup completo (dump) exige PostgreSQL. Use o instantâneo em CSV.', 'danger')
         return redirect(url_for('main.index'))
-    finally:
-        if os.path.exists(backup_file_path):
-            os.remove(backup_file_path)
-        if 'PGPASSWORD' in os.environ:
-            del os.environ['PGPASSWORD']
+    else:
+        compressao = request.form.get('compressao', 'gzip')
+        if compressao not in backup.COMPRESSOES:
+            compressao = 'gzip'
+        tarefas.enfileirar('backup', f'smart_finance_backup_{momento}.dump', formato='dump', compressao=compressao)
+
+    flash('Backup enviado para processamento. O arquivo aparece em "Tarefas" quando ficar pronto.', 'info')
+    return redirect(url_for('main.index'))
 
 @main_bp.route('/restore', methods=['POST'])
 @login_required
 def restore_database():
-    if 'backup_file' not in request.files:
+    backup_file = request.files.get('backup_file')
+    if not backup_file or backup_file.filename == '':
         flash('Nenhum arquivo selecionado para restauração.', 'danger')
         return redirect(url_for('main.index'))
 
-    backup_file = request.files['backup_file']
-    if backup_file.filename == '':
-        flash('Nenhum arquivo selecionado para restauração.', 'danger')
+    # .dump: formato custom gerado por /backup; .sql: backups antigos em texto
+    extensao = os.path.splitext(backup_file.filename.lower())[1]
+    if extensao not in ('.sql', '.dump'):
+        flash('Formato de arquivo inválido. Por favor, envie um arquivo .dump ou .sql.', 'danger')
+        return redirect(url_for('main.index'))
+    if db.session.get_bind().dialect.name != 'postgresql':
+        flash('A restauração exige PostgreSQL.', 'danger')
+        return redirect(url_for('main.index'))
+    if tarefas.em_andamento('restauracao'):
+        flash('Já existe uma restauração em andamento.', 'warning')
         return redirect(url_for('main.index'))
 
-    if backup_file and backup_file.filename.endswith('.sql'):
-        db_user = os.getenv('DB_USER')
-        db_password = os.getenv('DB_PASSWORD')
-        db_host = os.getenv('DB_HOST')
-        db_name = os.getenv('DB_NAME')
-        db_port = os.getenv('DB_PORT')
+    # O worker lê o arquivo da pasta de tarefas, compartilhada com o site
+    caminho = tarefas.caminho_arquivo('upload', f'{uuid.uuid4().hex}{extensao}')
+    backup_file.save(caminho)
+    tarefas.enfileirar('restauracao', caminho=caminho, extensao=extensao)
+    flash('Restauração enviada para processamento. O sistema continua disponível até a troca final do banco.', 'info')
+    return redirect(url_for('main.index'))
 
-        with tempfile.NamedTemporaryFile(mode='w+b', delete=False, suffix='.sql') as temp_file:
-            temp_file.write(backup_file.read())
-            uploaded_file_path = temp_file.name
 
-        try:
-            os.environ['PGPASSWORD'] = db_password
-
-            disconnect_command = [
-                'psql',
-                '-h', db_host,
-                '-p', db_port,
-                '-U', db_user,
-                '-d', 'postgres',
-                '-c', f"SELECT pg_terminate_backend(pg_stat_activity.pid) FROM pg_stat_activity WHERE pg_stat_activity.datname = '{db_name}' AND pid <> pg_backend_pid();"
-            ]
-            subprocess.run(disconnect_command, check=True, capture_output=True)
-
-            drop_db_command = [
-                'dropdb',
-                '-h', db_host,
-                '-p', db_port,
-                '-U', db_user,
-                db_name
-            ]
-            subprocess.run(drop_db_command, check=True, capture_output=True)
-
-            create_db_command = [
-                'createdb',
-                '-h', db_host,
-                '-p', db_port,
-                '-U', db_user,
-                db_name
-            ]
-            subprocess.run(create_db_command, check=True, capture_output=True)
-
-            restore_command = [
-                'psql',
-                '-h', db_host,
-                '-p', db_port,
-                '-U', db_user,
-                '-d', db_name,
-                '-f', uploaded_file_path
-            ]
-            
-            process = subprocess.run(restore_command, check=True, capture_output=True)
-            flash('Banco de dados restaurado com sucesso!', 'success')
-        except subprocess.CalledProcessError as e:
-            flash(f'Erro ao restaurar banco de dados: {e.stderr.decode()}', 'danger')
-        except Exception as e:
-            flash(f'Ocorreu um erro inesperado ao restaurar o banco de dados: {str(e)}', 'danger')
-        finally:
-            if os.path.exists(uploaded_file_path):
-                os.remove(uploaded_file_path)
-            if 'PGPASSWORD' in os.environ:
-                del os.environ['PGPASSWORD']
+@main_bp.route('/resumo/reconstruir', methods=['POST'])
+@login_required
+def reconstruir_resumo():
+    if tarefas.em_andamento('resumo'):
+        flash('O resumo dos relatórios já está sendo recalculado.', 'warning')
     else:
-        flash('Formato de arquivo inválido. Por favor, envie um arquivo .sql.', 'danger')
-    
-    return redirect(url_for('main.index'))
\ No newline at end of file
+        tarefas.enfileirar('resumo')
+        flash('Recálculo do resumo dos relatórios enviado para processamento.', 'info')
+    return redirect(url_for('main.index'))
+
+
+@main_bp.route('/tarefas')
+@login_required
+@conexao.repetir_leitura
+def listar_tarefas():
+    return jsonify([tarefa.to_dict() for tarefa in tarefas.recentes()])
+
+
+@main_bp.route('/tarefas/<int:id>')
+@login_required
+@conexao.repetir_leitura
+def tarefa_detalhe(id):
+    return jsonify(Tarefa.query.get_or_404(id).to_dict())
+
+
+@main_bp.route('/tarefas/<int:id>/download')
+@login_required
+def baixar_tarefa(id):
+    tarefa = Tarefa.query.get_or_404(id)
+    if tarefa.status != 'concluida' or not tarefa.arquivo or not os.path.exists(tarefa.arquivo):
+        abort(404)
+    return send_file(tarefa.arquivo, as_attachment=True, download_name=tarefa.nome_arquivo)
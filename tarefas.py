@@ -0,0 +1,228 @@
+"""Fila de tarefas demoradas, executadas fora dos workers web.
+
+Backups, restaurações, exportações em segundo plano e a reconstrução do
+resumo dos relatórios são gravados na tabela `tarefas` e executados pelo
+processo `worker.py`, iniciado à parte do `app.py`. Assim um backup de vários
+minutos não prende um worker do gunicorn nem esbarra no timeout dele.
+
+A tela acompanha o andamento em `/tarefas` e baixa o arquivo gerado quando a
+tarefa termina. Os arquivos ficam em `TAREFAS_DIR` (padrão: pasta temporária
+do sistema, compartilhada pelo worker e pelo site) por `RETENCAO` dias.
+
+Vários workers podem rodar ao mesmo tempo: cada tarefa é reservada com
+`FOR UPDATE SKIP LOCKED` e um UPDATE condicional ao status.
+"""
+import contextlib
+import json
+import logging
+import os
+import tempfile
+from datetime import date, datetime, timedelta, timezone
+from sqlalchemy import update
+from models import db, Tarefa
+import backup
+import exportacao
+import restauracao
+import resumo
+
+DIRETORIO = os.getenv('TAREFAS_DIR') or os.path.join(tempfile.gettempdir(), 'smart_finance_tarefas')
+RETENCAO = timedelta(days=7)
+# Tarefa em execução sem atualização por este tempo: o worker que a executava parou
+EXPIRACAO = timedelta(hours=1)
+# Intervalo (em bytes gravados) entre atualizações do andamento
+INTERVALO_ANDAMENTO = 4 * 1024 * 1024
+
+log = logging.getLogger(__name__)
+
+
+class ErroTarefa(Exception):
+    pass
+
+
+def _agora():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def enfileirar(tipo, nome_arquivo=None, **parametros):
+    """Cria uma tarefa pendente e confirma a transação."""
+    if tipo not in EXECUTORES:
+        raise ErroTarefa(f'Tipo de tarefa desconhecido: {tipo}')
+    tarefa = Tarefa(tipo=tipo, parametros=json.dumps(parametros), nome_arquivo=nome_arquivo,
+                    etapa='Aguardando o worker')
+    db.session.add(tarefa)
+    db.session.commit()
+    return tarefa
+
+
+def em_andamento(tipo):
+    return db.session.query(Tarefa.id).filter(
+        Tarefa.tipo == tipo, Tarefa.status.in_(('pendente', 'executando'))
+    ).first() is not None
+
+
+def recentes(limite=10):
+    return Tarefa.query.order_by(Tarefa.id.desc()).limit(limite).all()
+
+
+def caminho_arquivo(tarefa_id, nome_arquivo):
+    os.makedirs(DIRETORIO, exist_ok=True)
+    return os.path.join(DIRETORIO, f'{tarefa_id}_{nome_arquivo}')
+
+
+def atualizar(tarefa_id, **valores):
+    """Grava o andamento em uma transação própria, sem interferir na da tarefa."""
+    with db.engine.begin() as conexao:
+        conexao.execute(update(Tarefa).where(Tarefa.id == tarefa_id).values(atualizada_em=_agora(), **valores))
+
+
+def _gravar(tarefa_id, blocos, caminho, total_estimado=None):
+    """Grava os blocos de bytes em `caminho`, informando o andamento."""
+    gravados = proximo_aviso = 0
+    try:
+        with open(caminho, 'wb') as arquivo:
+            for bloco in blocos:
+                arquivo.write(bloco)
+                gravados += len(bloco)
+                if gravados >= proximo_aviso:
+                    proximo_aviso = gravados + INTERVALO_ANDAMENTO
+                    progresso = min(99, gravados * 100 // total_estimado) if total_estimado else 0
+                    atualizar(tarefa_id, etapa=f'{gravados / 1024 / 1024:.1f} MB gravados', progresso=progresso)
+    except BaseException:
+        # Não deixa arquivo pela metade na pasta de tarefas, sem encobrir o erro original
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(caminho)
+        raise
+
+
+# Executores: recebem a tarefa e os parâmetros e devolvem o arquivo gerado (ou None)
+
+def _backup(tarefa, parametros):
+    caminho = caminho_arquivo(tarefa.id, tarefa.nome_arquivo)
+    if parametros['formato'] == 'csv':
+        _gravar(tarefa.id, backup.snapshot_csv(), caminho)
+    else:
+        # O dump sai compactado, então o tamanho do banco só serve de teto para o percentual
+        total = backup.tamanho_banco()
+        _gravar(tarefa.id, backup.dump_postgres(parametros['compressao']), caminho, total)
+    return caminho
+
+
+def _exportacao(tarefa, parametros):
+    caminho = caminho_arquivo(tarefa.id, tarefa.nome_arquivo)
+    blocos = exportacao.linhas_csv(
+        parametros['recurso'], date.fromisoformat(parametros['inicio']),
+        date.fromisoformat(parametros['fim']), parametros['separador'],
+    )
+    blocos = exportacao.compactar(blocos) if parametros['gzip'] else (bloco.encode('utf-8') for bloco in blocos)
+    _gravar(tarefa.id, blocos, caminho)
+    return caminho
+
+
+def _restauracao(tarefa, parametros):
+    dados = {coluna.name: getattr(tarefa, coluna.name) for coluna in Tarefa.__table__.columns}
+    try:
+        restauracao.restaurar(
+            parametros['caminho'], parametros['extensao'],
+            lambda etapa, progresso: atualizar(tarefa.id, etapa=ETAPAS_RESTAURACAO[etapa], progresso=progresso),
+        )
+    finally:
+        # Sem encobrir o erro da restauração se o arquivo já tiver sido apagado
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(parametros['caminho'])
+    # O banco agora é o restaurado (com a tabela `tarefas` criada na migração):
+    # recria nele o registro desta tarefa para receber o resultado
+    db.session.merge(Tarefa(**dados))
+    db.session.commit()
+    if db.engine.dialect.name == 'postgresql':
+        with db.engine.begin() as conexao:
+            conexao.exec_driver_sql(
+                "SELECT setval(pg_get_serial_sequence('tarefas', 'id'), (SELECT MAX(id) FROM tarefas))"
+            )
+    return None
+
+
+def _resumo(tarefa, parametros):
+    atualizar(tarefa.id, etapa='Recalculando o resumo diário')
+    dias = resumo.reconstruir_resumo()
+    atualizar(tarefa.id, mensagem=f'{dias} dias recalculados.')
+    return None
+
+
+EXECUTORES = {
+    'backup': _backup,
+    'exportacao': _exportacao,
+    'restauracao': _restauracao,
+    'resumo': _resumo,
+}
+
+ETAPAS_RESTAURACAO = {
+    'preparando': 'Preparando banco temporário',
+    'restaurando': 'Restaurando backup',
+    'migrando': 'Atualizando o esquema do banco restaurado',
+    'validando': 'Validando dados restaurados',
+    'trocando': 'Trocando para o banco restaurado',
+}
+
+
+def _reservar():
+    """Marca como em execução a próxima tarefa pendente; None se a fila estiver vazia."""
+    while True:
+        candidata = (
+            db.session.query(Tarefa.id).filter(Tarefa.status == 'pendente').order_by(Tarefa.id)
+            .with_for_update(skip_locked=True).limit(1).scalar()
+        )
+        if candidata is None:
+            db.session.rollback()
+            return None
+        reservada = db.session.execute(
+            update(Tarefa).where(Tarefa.id == candidata, Tarefa.status == 'pendente')
+            .values(status='executando', etapa='Iniciando', iniciada_em=_agora(), atualizada_em=_agora())
+        ).rowcount
+        db.session.commit()
+        if reservada:
+            return db.session.get(Tarefa, candidata)
+
+
+def executar(tarefa):
+    tarefa_id, tipo = tarefa.id, tarefa.tipo
+    try:
+        arquivo = EXECUTORES[tipo](tarefa, json.loads(tarefa.parametros or '{}'))
+    except Exception as e:
+        db.session.rollback()
+        log.exception('Falha na tarefa %s (%s)', tarefa_id, tipo)
+        atualizar(tarefa_id, status='erro', mensagem=str(e)[:2000], concluida_em=_agora())
+    else:
+        db.session.commit()
+        atualizar(tarefa_id, status='concluida', etapa='Concluída', progresso=100, arquivo=arquivo,
+                  concluida_em=_agora())
+
+
+def executar_proxima():
+    """Executa a próxima tarefa da fila. Retorna False se não havia nenhuma."""
+    tarefa = _reservar()
+    if tarefa is None:
+        return False
+    log.info('Executando tarefa %s (%s)', tarefa.id, tarefa.tipo)
+    executar(tarefa)
+    db.session.remove()
+    return True
+
+
+def abandonar_expiradas():
+    """Marca com erro as tarefas cujo worker parou no meio da execução."""
+    db.session.execute(
+        update(Tarefa).where(Tarefa.status == 'executando', Tarefa.atualizada_em < _agora() - EXPIRACAO)
+        .values(status='erro', mensagem='A tarefa foi interrompida (o worker parou durante a execução).',
+                concluida_em=_agora())
+    )
+    db.session.commit()
+
+
+def limpar_antigas():
+    """Apaga as tarefas concluídas há mais de RETENCAO e os arquivos delas."""
+    antigas = Tarefa.query.filter(Tarefa.concluida_em < _agora() - RETENCAO).all()
+    for tarefa in antigas:
+        if tarefa.arquivo and os.path.exists(tarefa.arquivo):
+            os.remove(tarefa.arquivo)
+        db.session.delete(tarefa)
+    db.session.commit()
@@ -1,24 +1,110 @@
-from sqlalchemy import extract
-from datetime import datetime, timezone
+from sqlalchemy import func
+from datetime import date, datetime, time, timedelta, timezone
+import calendar
+import unicodedata
 import pytz
 
+TZ_LOJA = pytz.timezone('America/Sao_Paulo')
+# Anos aceitos nos filtros: os períodos somam um ano/dia e ainda precisam caber em `date`
+ANO_MINIMO, ANO_MAXIMO = date.min.year + 1, date.max.year - 1
+
 def format_datetime_local(dt):
     if dt.tzinfo is None:
         dt = dt.replace(tzinfo=timezone.utc)
-    
-    local_tz = pytz.timezone('America/Sao_Paulo')
-    local_dt = dt.astimezone(local_tz)
+
+    local_dt = dt.astimezone(TZ_LOJA)
     return local_dt.strftime('%d/%m/%y %H:%M')
 
-def filtros_data(model, data_field, dia=None, mes=None, ano=None):
-    filtros = []
-    if mes:
-        filtros.append(extract('month', getattr(model, data_field)) == mes)
-    if ano:
-        filtros.append(extract('year', getattr(model, data_field)) == ano)
+def data_local(dt):
+    """Retorna a data (no fuso da loja) de um datetime salvo em UTC."""
+    if dt is None:
+        dt = datetime.now(timezone.utc)
+    elif dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(TZ_LOJA).date()
+
+def dia_local_sql(coluna, dialeto):
+    """Expressão SQL que converte uma coluna DateTime (UTC) para a data local da loja."""
+    if dialeto == 'postgresql':
+        return func.date(func.timezone(TZ_LOJA.zone, func.timezone('UTC', coluna)))
+    # SQLite não conhece fusos horários: usa o deslocamento atual da loja.
+    minutos = int(datetime.now(TZ_LOJA).utcoffset().total_seconds() // 60)
+    return func.date(coluna, f'{minutos:+d} minutes')
+
+def periodo_local(dia=None, mes=None, ano=None):
+    """Intervalo de datas [inicio, fim) correspondente ao filtro de dia/mês/ano."""
+    if not mes:
+        return date(ano, 1, 1), date(ano + 1, 1, 1)
+    ultimo_dia = calendar.monthrange(ano, mes)[1]
     if dia:
-        filtros.append(extract('day', getattr(model, data_field)) == dia)
-    return filtros
+        inicio = date(ano, mes, min(dia, ultimo_dia))
+        return inicio, inicio + timedelta(days=1)
+    fim = date(ano + 1, 1, 1) if mes == 12 else date(ano, mes + 1, 1)
+    return date(ano, mes, 1), fim
+
+def agora_local():
+    return datetime.now(TZ_LOJA)
+
+def inicio_do_dia_utc(dia):
+    """Meia-noite da data local `dia`, como datetime UTC sem fuso (formato salvo no banco)."""
+    return TZ_LOJA.localize(datetime.combine(dia, time())).astimezone(timezone.utc).replace(tzinfo=None)
+
+def intervalo_utc(inicio, fim):
+    """Converte o intervalo de datas locais [inicio, fim) em datetimes UTC [inicio, fim)."""
+    return inicio_do_dia_utc(inicio), inicio_do_dia_utc(fim)
+
+def filtros_data(model, data_field, dia=None, mes=None, ano=None):
+    """Filtros de intervalo [início, fim) para o dia/mês/ano no fuso da loja.
+
+    Comparações diretas com a coluna permitem usar os índices em `data`.
+    """
+    if not (dia or mes or ano):
+        return []
+    coluna = getattr(model, data_field)
+    inicio, fim = intervalo_utc(*periodo_local(dia, mes, ano or agora_local().year))
+    return [coluna >= inicio, coluna < fim]
+
+# Código normalizado -> rótulo exibido. Novas formas entram aqui e em _PALAVRAS_PAGAMENTO.
+FORMAS_PAGAMENTO = {
+    'dinheiro': 'Dinheiro',
+    'pix': 'Pix',
+    'credito': 'Crédito',
+    'debito': 'Débito',
+    'boleto': 'Boleto',
+    'voucher': 'Voucher',
+    'outro': 'Outro',
+}
+
+_PALAVRAS_PAGAMENTO = {
+    'dinheiro': 'dinheiro',
+    'especie': 'dinheiro',
+    'pix': 'pix',
+    'credito': 'credito',
+    'debito': 'debito',
+    'boleto': 'boleto',
+    'voucher': 'voucher',
+    'vale': 'voucher',
+}
+
+def normalizar_texto(texto):
+    """Texto em minúsculas e sem acentos, para comparações e pesquisa."""
+    return unicodedata.normalize('NFKD', texto or '').encode('ascii', 'ignore').decode().lower().strip()
+
+def normalizar_pagamento(forma_pagamento):
+    """Converte o texto livre da forma de pagamento em um código de FORMAS_PAGAMENTO."""
+    texto = normalizar_texto(forma_pagamento)
+    if not texto:
+        return None
+    encontrados = [(texto.find(palavra), codigo) for palavra, codigo in _PALAVRAS_PAGAMENTO.items() if palavra in texto]
+    return min(encontrados)[1] if encontrados else 'outro'
+
+def subtipo_servico(tipo, subtipo_venda=None):
+    """Subtipo do serviço (Manutenção, Reforma ou Revenda) a partir do tipo e da escolha do formulário."""
+    if tipo == 'Manutenção':
+        return 'Manutenção'
+    if tipo == 'Venda de Aparelho':
+        return 'Revenda' if subtipo_venda == 'Revenda' else 'Reforma'
+    return None
 
 def to_float(valor, default=0.0):
     try:
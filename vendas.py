@@ -0,0 +1,85 @@
+"""Vendas com vários itens (carrinho) em uma única transação.
+
+Todos os itens baixam o estoque em um único UPDATE, as saídas são inseridas
+de uma vez (INSERT de várias linhas) ligadas à mesma `Venda` e, se o pagamento
+for em dinheiro, o caixa recebe um único lançamento com o total da venda
+(origem_tipo='venda'). Edições e exclusões de um item dessa venda ajustam esse
+lançamento consolidado em vez de criar um por item.
+"""
+from sqlalchemy import insert
+from models import db, Saida, Venda, Caixa
+from utils import data_local, normalizar_pagamento
+import inventario
+import livro_caixa
+import resumo
+
+
+def registrar(itens, forma_pagamento, cliente):
+    """Registra a venda de `itens` [(produto_id, quantidade, preco_unitario)] e devolve a `Venda`."""
+    if not itens:
+        raise ValueError('Adicione ao menos um item à venda.')
+    quantidades = {}
+    for produto_id, quantidade, preco_unitario in itens:
+        if quantidade <= 0 or preco_unitario < 0:
+            raise ValueError('Quantidade e preço dos itens devem ser positivos.')
+        quantidades[produto_id] = quantidades.get(produto_id, 0) - quantidade
+    produtos = inventario.movimentar_em_lote(quantidades)
+
+    venda = Venda()
+    db.session.add(venda)
+    db.session.flush()
+
+    codigo = normalizar_pagamento(forma_pagamento)
+    linhas = [{
+        'data': venda.data,
+        'venda_id': venda.id,
+        'produto_id': produto_id,
+        'quantidade': quantidade,
+        'preco_unitario': preco_unitario,
+        'custo_unitario': produtos[produto_id].custo,
+        'total_venda': quantidade * preco_unitario,
+        'forma_pagamento': forma_pagamento,
+        'pagamento_codigo': codigo,
+        'cliente': cliente,
+    } for produto_id, quantidade, preco_unitario in itens]
+    db.session.execute(insert(Saida), linhas)
+
+    total = sum(linha['total_venda'] for linha in linhas)
+    resumo.somar(
+        data_local(venda.data),
+        {'receita_produtos': total,
+         'custo_produtos': sum(linha['custo_unitario'] * linha['quantidade'] for linha in linhas)},
+        {codigo: total} if codigo else None,
+    )
+
+    if codigo == 'dinheiro':
+        nomes = ', '.join(dict.fromkeys(produtos[produto_id].nome for produto_id, _, _ in itens))
+        livro_caixa.lancar(tipo='Entrada', valor=total, descricao=f'Venda: {nomes}'[:255],
+                           origem_id=venda.id, origem_tipo='venda')
+    return venda
+
+
+def valor_em_dinheiro(saida):
+    return saida.total_venda if saida.pagamento_codigo == 'dinheiro' else 0.0
+
+
+def ajustar_caixa(saida, delta):
+    """Soma `delta` ao lançamento de caixa da venda à qual `saida` pertence."""
+    if not delta:
+        return
+    transacao = Caixa.query.filter_by(origem_id=saida.venda_id, origem_tipo='venda').first()
+    if transacao is None:
+        if delta > 0:
+            livro_caixa.lancar(tipo='Entrada', valor=delta, descricao=f'Venda: {saida.produto.nome}',
+                               origem_id=saida.venda_id, origem_tipo='venda')
+    elif transacao.valor + delta > 0.005:
+        livro_caixa.alterar_valor(transacao, transacao.valor + delta)
+    else:
+        livro_caixa.remover(transacao)
+
+
+def itens(saida):
+    """Todas as saídas da venda de `saida` (só ela, se for uma venda de um item)."""
+    if saida.venda_id is None:
+        return [saida]
+    return Saida.query.filter_by(venda_id=saida.venda_id).order_by(Saida.id).all()
@@ -0,0 +1,126 @@
+"""Versões das tabelas e respostas condicionais (ETag / 304).
+
+Cada gravação em produtos, entradas, saídas, serviços, caixa ou no resumo
+dos relatórios incrementa o contador da tabela em `versoes_tabelas`, na mesma
+transação. As tabelas alteradas são anotadas nos eventos de flush e de
+UPDATE/DELETE em massa do SQLAlchemy e os contadores só são incrementados no
+commit, em ordem fixa: a linha de cada contador fica travada só no final da
+transação, sem disputar a ordem com as travas de estoque, caixa e resumo.
+
+As telas calculam o ETag a partir desses contadores, da época do banco (nova
+a cada restauração de backup, ver `nova_epoca`), da URL e do dia local; se o
+navegador já tem a versão atual, a resposta é 304 sem executar as consultas
+nem renderizar o template.
+"""
+import hashlib
+import secrets
+from functools import wraps
+from itertools import chain
+from flask import request, session, make_response
+from flask_login import current_user
+from sqlalchemy import event, insert, update
+from sqlalchemy.orm import Session
+from models import db, Produto, Entrada, Saida, Servico, Caixa, ResumoDiario, ResumoPagamento, VersaoTabela
+from utils import agora_local
+
+RASTREADAS = {model: model.__tablename__
+              for model in (Produto, Entrada, Saida, Servico, Caixa, ResumoDiario, ResumoPagamento)}
+# Linha de `versoes_tabelas` com a época do banco, trocada a cada restauração
+EPOCA = '_epoca'
+
+
+def _incrementar(conexao, tabelas):
+    for tabela in sorted(tabelas):
+        alterado = conexao.execute(
+            update(VersaoTabela).where(VersaoTabela.tabela == tabela)
+            .values(versao=VersaoTabela.versao + 1)
+        ).rowcount
+        if not alterado:
+            conexao.execute(insert(VersaoTabela).values(tabela=tabela, versao=1))
+
+
+def _anotar(sessao, tabelas):
+    if tabelas:
+        sessao.info.setdefault('tabelas_alteradas', set()).update(tabelas)
+
+
+@event.listens_for(Session, 'after_flush')
+def _registrar_flush(sessao, contexto):
+    alterados = chain(sessao.new, sessao.deleted, (obj for obj in sessao.dirty if sessao.is_modified(obj)))
+    _anotar(sessao, {RASTREADAS[type(obj)] for obj in alterados if type(obj) in RASTREADAS})
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _registrar_em_massa(estado):
+    # query.update()/delete() e insert/update(Model) em lote não passam pelo flush
+    if (estado.is_insert or estado.is_update or estado.is_delete) and estado.bind_mapper is not None:
+        tabela = RASTREADAS.get(estado.bind_mapper.class_)
+        if tabela:
+            _anotar(estado.session, {tabela})
+
+
+@event.listens_for(Session, 'before_commit')
+def _incrementar_no_commit(sessao):
+    # before_commit roda antes do flush final do commit: grava o pendente para anotar tudo
+    sessao.flush()
+    tabelas = sessao.info.pop('tabelas_alteradas', None)
+    if tabelas:
+        _incrementar(sessao.connection(), tabelas)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _descartar_tabelas(sessao):
+    sessao.info.pop('tabelas_alteradas', None)
+
+
+def nova_epoca():
+    """Invalida todos os ETags já emitidos (ex.: depois de restaurar um backup).
+
+    Os contadores do banco restaurado podem repetir valores que os navegadores
+    já conhecem do banco anterior; a época aleatória entra em todo ETag.
+    """
+    valor = secrets.randbelow(2 ** 31)
+    if not db.session.execute(update(VersaoTabela).where(VersaoTabela.tabela == EPOCA).values(versao=valor)).rowcount:
+        db.session.execute(insert(VersaoTabela).values(tabela=EPOCA, versao=valor))
+    db.session.commit()
+
+
+def versoes(*tabelas):
+    linhas = dict(
+        db.session.query(VersaoTabela.tabela, VersaoTabela.versao)
+        .filter(VersaoTabela.tabela.in_(tabelas))
+        .all()
+    )
+    return [linhas.get(tabela, 0) for tabela in tabelas]
+
+
+def etag(*tabelas):
+    """ETag da requisição atual para uma resposta que depende de `tabelas`."""
+    chave = '|'.join(map(str, [
+        request.endpoint, request.full_path, current_user.get_id(),
+        agora_local().date(), *versoes(EPOCA, *tabelas),
+    ]))
+    return hashlib.sha1(chave.encode()).hexdigest()
+
+
+def condicional(*tabelas):
+    """Decorator: responde 304 aos GETs cujo ETag o navegador já possui."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            # Mensagens flash pendentes precisam ser exibidas na página
+            if request.method != 'GET' or '_flashes' in session:
+                return view(*args, **kwargs)
+
+            valor = etag(*tabelas)
+            if valor in request.if_none_match:
+                resposta = make_response('', 304)
+            else:
+                resposta = make_response(view(*args, **kwargs))
+                if resposta.status_code != 200:
+                    return resposta
+            resposta.set_etag(valor)
+            resposta.headers['Cache-Control'] = 'private, no-cache'
+            return resposta
+        return wrapper
+    return decorator
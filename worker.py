@@ -0,0 +1,57 @@
+"""Worker das tarefas em segundo plano (backup, restauração, exportação, resumo).
+
+Roda à parte do servidor web, com o mesmo .env (a tabela `tarefas` é criada
+pelo init_db.py):
+
+    python worker.py
+
+Pode haver mais de um worker; cada tarefa é executada por um só (ver tarefas.py).
+SIGTERM/SIGINT encerram o worker depois da tarefa em execução.
+"""
+import logging
+import signal
+import time
+from __init__ import create_app
+from models import db
+import tarefas
+
+INTERVALO = 2  # segundos de espera com a fila vazia
+INTERVALO_LIMPEZA = 3600
+
+log = logging.getLogger('worker')
+parar = False
+
+
+def _encerrar(sinal, quadro):
+    global parar
+    log.info('Sinal %s recebido, encerrando após a tarefa atual.', sinal)
+    parar = True
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    signal.signal(signal.SIGTERM, _encerrar)
+    signal.signal(signal.SIGINT, _encerrar)
+
+    app = create_app()
+    with app.app_context():
+        tarefas.abandonar_expiradas()
+        ultima_limpeza = float('-inf')
+        log.info('Worker iniciado; arquivos em %s', tarefas.DIRETORIO)
+        while not parar:
+            if time.monotonic() - ultima_limpeza >= INTERVALO_LIMPEZA:
+                tarefas.limpar_antigas()
+                ultima_limpeza = time.monotonic()
+            try:
+                executou = tarefas.executar_proxima()
+            except Exception:
+                # Banco fora do ar, por exemplo: tenta de novo no próximo ciclo
+                log.exception('Erro ao buscar a próxima tarefa')
+                db.session.remove()
+                executou = False
+            if not executou:
+                time.sleep(INTERVALO)
+
+
+if __name__ == '__main__':
+    main()